@@ -0,0 +1,55 @@
+import statistics
+import time
+import uuid
+import numpy as np
+from main import ChromaVectorIndex, NumpyVectorIndex
+
+# Find the corpus size where the Chroma index overtakes the NumPy brute-force index
+# for one request's workload: build the index once, then run a handful of queries.
+# Embeddings are random and passed in directly so only the index itself is measured.
+DOCUMENT_COUNTS = [10, 50, 100, 500, 1000, 5000, 10000, 20000, 50000]
+EMBEDDING_DIM = 384
+QUERIES_PER_REQUEST = 8
+N_RESULTS = 40
+REPEATS = 3
+
+def bench_index(index_class, doc_count: int, rng: np.random.Generator) -> dict:
+    embeddings = rng.standard_normal((doc_count, EMBEDDING_DIM)).astype(np.float32)
+    queries = rng.standard_normal((QUERIES_PER_REQUEST, EMBEDDING_DIM)).astype(np.float32)
+    ids = [f"id_{i}" for i in range(doc_count)]
+    documents = [f"file_{i}.js" for i in range(doc_count)]
+    metadatas = [{"path": d} for d in documents]
+
+    build_ms, query_ms = [], []
+    for _ in range(REPEATS):
+        # 1. Build: create the index and add every document
+        start = time.perf_counter()
+        index = index_class(f"bench_{uuid.uuid4().hex}")
+        for batch in range(0, doc_count, 5000):
+            index.add(ids[batch:batch + 5000], documents[batch:batch + 5000], metadatas[batch:batch + 5000], embeddings[batch:batch + 5000])
+        build_ms.append((time.perf_counter() - start) * 1000)
+
+        # 2. Query: one batched multi-query, as a request would issue it
+        start = time.perf_counter()
+        index.query(query_embeddings=queries, n_results=min(N_RESULTS, doc_count))
+        query_ms.append((time.perf_counter() - start) * 1000)
+        index.delete()
+
+    return {"build_ms": statistics.median(build_ms), "query_ms": statistics.median(query_ms)}
+
+def run_benchmark():
+    rng = np.random.default_rng(0)
+    print(f"{'docs':>6}{'numpy build':>14}{'numpy query':>14}{'chroma build':>15}{'chroma query':>15}{'winner':>8}")
+    for doc_count in DOCUMENT_COUNTS:
+        numpy_result = bench_index(NumpyVectorIndex, doc_count, rng)
+        chroma_result = bench_index(ChromaVectorIndex, doc_count, rng)
+        numpy_total = numpy_result["build_ms"] + numpy_result["query_ms"]
+        chroma_total = chroma_result["build_ms"] + chroma_result["query_ms"]
+        winner = "numpy" if numpy_total <= chroma_total else "chroma"
+        print(
+            f"{doc_count:>6}{numpy_result['build_ms']:>14.2f}{numpy_result['query_ms']:>14.2f}"
+            f"{chroma_result['build_ms']:>15.2f}{chroma_result['query_ms']:>15.2f}{winner:>8}"
+        )
+
+if __name__ == "__main__":
+    run_benchmark()
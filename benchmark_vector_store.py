@@ -0,0 +1,62 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+import numpy as np
+from chromadb import EphemeralClient, PersistentClient
+
+# Compare per-request indexing cost of the in-memory and persistent Chroma backends.
+# Embeddings are random and passed in directly so only the store itself is measured.
+DOCUMENT_COUNTS = [10, 100, 500, 2000]
+EMBEDDING_DIM = 384
+QUERY_REPEATS = 50
+N_RESULTS = 40
+
+def bench_backend(client, doc_count: int, rng: np.random.Generator) -> dict:
+    embeddings = rng.standard_normal((doc_count, EMBEDDING_DIM)).astype(np.float32)
+    documents = [f"file_{i}.js\nconsole.log({i});" for i in range(doc_count)]
+    ids = [f"id_{i}" for i in range(doc_count)]
+    name = f"bench_{uuid.uuid4().hex}"
+
+    # 1. Ingest: create the collection and add every document
+    start = time.perf_counter()
+    collection = client.create_collection(name=name, embedding_function=None)
+    collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=[{"path": d.split("\n")[0]} for d in documents])
+    ingest_ms = (time.perf_counter() - start) * 1000
+
+    # 2. Query: median latency of a top-k search
+    latencies = []
+    for _ in range(QUERY_REPEATS):
+        query = rng.standard_normal((1, EMBEDDING_DIM)).astype(np.float32)
+        start = time.perf_counter()
+        collection.query(query_embeddings=query, n_results=min(N_RESULTS, doc_count))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # 3. Cleanup, as cleanup_chromadb does after every request
+    start = time.perf_counter()
+    client.delete_collection(name)
+    cleanup_ms = (time.perf_counter() - start) * 1000
+
+    return {"ingest_ms": ingest_ms, "query_ms": statistics.median(latencies), "cleanup_ms": cleanup_ms}
+
+def run_benchmark():
+    rng = np.random.default_rng(0)
+    persist_dir = tempfile.mkdtemp(prefix="chroma_bench_")
+    backends = {
+        "memory": EphemeralClient(),
+        "persistent": PersistentClient(path=persist_dir)
+    }
+
+    print(f"{'backend':<12}{'docs':>6}{'ingest ms':>12}{'query ms':>12}{'cleanup ms':>12}")
+    try:
+        for doc_count in DOCUMENT_COUNTS:
+            for backend, client in backends.items():
+                result = bench_backend(client, doc_count, rng)
+                print(f"{backend:<12}{doc_count:>6}{result['ingest_ms']:>12.1f}{result['query_ms']:>12.2f}{result['cleanup_ms']:>12.1f}")
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import sys
+from main import KNOWN_LIBRARY_SIGNATURES, LIBRARY_INDEX_PATH, LibraryIndex
+
+# Build the exact-match fingerprint index LibraryIndex loads from LIBRARY_INDEX_PATH.
+# Point it at directories of library distribution files (a CDN download, a node_modules
+# dist folder, /usr/share/javascript). Each .js/.css file is named from its license
+# header via KNOWN_LIBRARY_SIGNATURES, or from --name/--version for header-less files.
+LIBRARY_EXTENSIONS = (".js", ".css")
+
+def iter_library_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.lower().endswith(LIBRARY_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+def build_index(paths, name=None, version=None, existing=None) -> dict:
+    library_index = LibraryIndex(os.devnull, KNOWN_LIBRARY_SIGNATURES)
+    index = dict(existing or {})
+    for path in iter_library_files(paths):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except (UnicodeDecodeError, OSError) as e:
+            print(f"skip {path}: {e}", file=sys.stderr)
+            continue
+
+        match = (name, version or "") if name else library_index.match_signature(content)
+        if not match:
+            continue
+        index[LibraryIndex.content_hash(content)] = {"name": match[0], "version": match[1]}
+        print(f"{match[0]} {match[1]}\t{path}")
+    return index
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint library files for vendored-library detection")
+    parser.add_argument("paths", nargs="+", help="library files or directories to scan")
+    parser.add_argument("--output", default=LIBRARY_INDEX_PATH)
+    parser.add_argument("--name", help="library name for files without a recognisable header")
+    parser.add_argument("--version", help="library version used together with --name")
+    parser.add_argument("--merge", action="store_true", help="add to the existing index instead of replacing it")
+    args = parser.parse_args()
+
+    existing = {}
+    if args.merge and os.path.isfile(args.output):
+        with open(args.output, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    index = build_index(args.paths, args.name, args.version, existing)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(dict(sorted(index.items())), f, indent=1)
+    print(f"{len(index)} fingerprints written to {args.output}")
+
+if __name__ == "__main__":
+    main()
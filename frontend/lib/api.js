@@ -1,6 +1,11 @@
+const API_BASE_URL = 'http://localhost:8000';
+const POLL_INTERVAL_MS = 2000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 export const submitProject = async (formData) => {
   try {
-    const response = await fetch('http://localhost:8000/analyze-project', {
+    const response = await fetch(`${API_BASE_URL}/jobs`, {
       method: 'POST',
       body: formData,
       // Don't set Content-Type header - let browser set it automatically
@@ -12,9 +17,31 @@ export const submitProject = async (formData) => {
       throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
     }
 
-    return await response.json();
+    const { job_id } = await response.json();
+    return await pollJob(job_id);
   } catch (error) {
     console.error('Error in submitProject:', error);
     throw error;
   }
-};
\ No newline at end of file
+};
+
+export const pollJob = async (jobId) => {
+  while (true) {
+    const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+
+    if (!response.ok) {
+      const errorData = await response.json();
+      throw new Error(errorData.detail || `HTTP error! status: ${response.status}`);
+    }
+
+    const job = await response.json();
+    if (job.status === 'completed') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error?.detail || 'Evaluation failed');
+    }
+
+    await sleep(POLL_INTERVAL_MS);
+  }
+};
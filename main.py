@@ -1,14 +1,34 @@
 import os
 import zipfile
 import shutil
+import tempfile
+import time
+import asyncio
+import uuid
+import hashlib
+import sqlite3
+import threading
+import math
+import re
+import codecs
+import ast
+import resource
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import tiktoken
+from collections import OrderedDict, Counter
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
-from chromadb import PersistentClient
+from fastapi.responses import JSONResponse, StreamingResponse
+from chromadb import EphemeralClient, PersistentClient
 from chromadb.utils import embedding_functions
-from openai import OpenAI
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 import logging
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from pydantic import BaseModel
 import json
 from fastapi.middleware.cors import CORSMiddleware
@@ -21,7 +41,20 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers and warm shared clients for the lifetime of the app"""
+    app.state.readiness = {"chroma": False, "openai": False, "embedding_model": False, "tokenizer": False}
+    app.state.readiness_warnings = {}
+    app.state.background_tasks = [asyncio.create_task(workspace_janitor())]
+    app.state.background_tasks += [asyncio.create_task(job_worker(i)) for i in range(JOB_WORKERS)]
+    app.state.background_tasks.append(asyncio.create_task(warm_up(app.state.readiness, app.state.readiness_warnings)))
+    yield
+    for task in app.state.background_tasks:
+        task.cancel()
+    await close_clients()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,8 +65,89 @@ app.add_middleware(
 )
 
 CHROMA_DB_PATH = os.path.abspath("./chroma_db")
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "memory")  # "memory" or "persistent" for per-request indexing
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "auto")  # "auto", "numpy" or "chroma"
+NUMPY_INDEX_MAX_DOCUMENTS = int(os.getenv("NUMPY_INDEX_MAX_DOCUMENTS", "20000"))
+STUDENT_COLLECTION_PREFIX = "student_"
+STUDENT_INDEX_TTL_SECONDS = int(os.getenv("STUDENT_INDEX_TTL_SECONDS", str(14 * 24 * 3600)))
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+INDEX_BATCH_MAX_CHARS = int(os.getenv("INDEX_BATCH_MAX_CHARS", str(512 * 1024)))
 EMBEDDING_MODEL = "text-embedding-3-small"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+WORKSPACE_ROOT = os.path.abspath(os.getenv("WORKSPACE_ROOT", os.path.join(tempfile.gettempdir(), "project_workspaces")))
+WORKSPACE_PREFIX = "project_"
+WORKSPACE_TTL_SECONDS = int(os.getenv("WORKSPACE_TTL_SECONDS", "3600"))
+JANITOR_INTERVAL_SECONDS = int(os.getenv("JANITOR_INTERVAL_SECONDS", "300"))
+COLLECTION_PREFIX = "code_analysis_"
+COLLECTION_TTL_SECONDS = int(os.getenv("COLLECTION_TTL_SECONDS", "3600"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+BULK_MAX_EXTRACT_BYTES = int(os.getenv("BULK_MAX_EXTRACT_BYTES", str(1024 * 1024 * 1024)))  # inner zips of one upload
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "60"))
+LOCAL_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_PATH = os.path.abspath(os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+ANALYSIS_MODEL = "gpt-4.1"
+PROMPT_TEMPLATE_VERSION = "2"
+LLM_CACHE_PATH = os.path.abspath(os.getenv("LLM_CACHE_PATH", "./llm_cache.sqlite3"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+RESULT_STORE_PATH = os.path.abspath(os.getenv("RESULT_STORE_PATH", "./results.sqlite3"))
+SUPPORTED_EXTENSIONS = ('.html', '.js', '.jsx', '.ts', '.tsx', '.css', '.py', '.java', '.php')
+IGNORE_PATTERNS = os.getenv(
+    "IGNORE_PATTERNS",
+    "node_modules/,.git/,__MACOSX/,dist/,build/,.next/,venv/,.venv/,vendor/,__pycache__/"
+).split(",")
+MAX_ZIP_MEMBERS = int(os.getenv("MAX_ZIP_MEMBERS", "20000"))
+MAX_EXTRACT_BYTES = int(os.getenv("MAX_EXTRACT_BYTES", str(50 * 1024 * 1024)))
+GENERATED_NAME_PATTERN = re.compile(r"(\.min\.(js|css)$|[.-]bundle\.js$|\.[0-9a-f]{8,}\.(js|css)$|\.chunk\.(js|css)$)", re.IGNORECASE)
+GENERATED_HEADER_MARKERS = ("@generated", "DO NOT EDIT", "webpackBootstrap", "/******/", "/*! jQuery", "* Bootstrap v")
+GENERATED_SAMPLE_CHARS = 65536
+GENERATED_MAX_LINE_LENGTH = int(os.getenv("GENERATED_MAX_LINE_LENGTH", "1000"))
+GENERATED_MAX_LONG_LINE_SHARE = 0.8  # share of characters sitting in lines over GENERATED_MAX_LINE_LENGTH
+GENERATED_EMBEDDED_DATA_PATTERN = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]+|[A-Za-z0-9+/]{200,}={0,2}")
+GENERATED_MIN_WHITESPACE_RATIO = 0.05
+GENERATED_MAX_ENTROPY = 5.8
+LIBRARY_INDEX_PATH = os.path.abspath(os.getenv("LIBRARY_INDEX_PATH", "./library_fingerprints.json"))
+KNOWN_LIBRARY_SIGNATURES = [  # (name, license header pattern, distribution file name pattern)
+    ("jQuery", r"jQuery(?: JavaScript Library)? v(\d+\.\d+\.\d+)", r"^jquery"),
+    ("Bootstrap", r"Bootstrap(?: Icons)? v(\d+\.\d+\.\d+)", r"^bootstrap"),
+    ("Font Awesome", r"Font Awesome (?:Free |Pro )?(\d+\.\d+\.\d+)", r"^(font-?awesome|all|brands|solid|regular)\b"),
+    ("Popper.js", r"@popperjs/core v(\d+\.\d+\.\d+)|Popper\.js v(\d+\.\d+\.\d+)", r"^popper"),
+    ("Lodash", r"@license\s+Lodash (\d+\.\d+\.\d+)|lodash\.com/license.*?(\d+\.\d+\.\d+)", r"^lodash"),
+    ("Vue.js", r"Vue\.js v(\d+\.\d+\.\d+)", r"^vue\b"),
+    ("React", r"@license React\s.*?v(\d+\.\d+\.\d+)|React v(\d+\.\d+\.\d+)", r"^react(-dom)?\b"),
+    ("animate.css", r"animate\.css.*?(\d+\.\d+\.\d+)", r"^animate\b"),
+    ("normalize.css", r"normalize\.css v(\d+\.\d+\.\d+)", r"^normalize\b"),
+    ("Swiper", r"Swiper (\d+\.\d+\.\d+)", r"^swiper"),
+    ("AOS", r"AOS.*?v?(\d+\.\d+\.\d+).*?michalsnik", r"^aos\b"),
+    ("Chart.js", r"Chart\.js v(\d+\.\d+\.\d+)", r"^chart\b"),
+    ("Tailwind CSS", r"tailwindcss v(\d+\.\d+\.\d+)", r"^tailwind"),
+]
+LIBRARY_SIGNATURE_MIN_CHARS = 4096
+READ_CONCURRENCY = int(os.getenv("READ_CONCURRENCY", "16"))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1200"))
+RETRIEVAL_N_RESULTS = int(os.getenv("RETRIEVAL_N_RESULTS", "5"))  # vector results per query
+LEXICAL_N_RESULTS = int(os.getenv("LEXICAL_N_RESULTS", "10"))  # BM25 results per query
+RRF_K = 60
+RETRIEVAL_EVIDENCE_PER_COMPONENT = 3
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = relevance only, 0.0 = diversity only
+MMR_DUPLICATE_SIMILARITY = float(os.getenv("MMR_DUPLICATE_SIMILARITY", "0.97"))  # drop chunks this close to a chosen one
+BM25_K1 = 1.5
+BM25_B = 0.75
+LEXICAL_STOP_WORDS = {"a", "an", "and", "the", "for", "of", "to", "in", "on", "with", "by", "or", "is", "be", "as", "at", "from", "using", "use"}
+HTML_SECTION_PATTERN = re.compile(r"^\s*<(head|body|header|nav|main|section|article|aside|footer|form|div|script|style|table|ul|ol)\b", re.IGNORECASE)
+FUNCTION_START_PATTERN = re.compile(r"^\s*((public|private|protected|static|async|export|default|final|abstract)\s+)*(function\b|class\b|[\w<>\[\],]+\s+\w+\s*\([^;]*$)")
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "60000"))
+MIN_TRUNCATED_TOKENS = 200
+SMALL_PROJECT_TOKEN_THRESHOLD = int(os.getenv("SMALL_PROJECT_TOKEN_THRESHOLD", "30000"))
+TOKENIZER_ENCODING = "o200k_base"
+INGESTION_MODE = os.getenv("INGESTION_MODE", "memory")  # "memory" reads the zip directly, "disk" extracts it first
+
+jobs: Dict[str, dict] = {}
+job_queue: asyncio.Queue = asyncio.Queue()
+active_workspaces: set = set()  # created and not yet removed; never reaped by the janitor
 
 
 class ScoringPattern(BaseModel):
@@ -47,64 +161,1356 @@ class AnalysisRequest(BaseModel):
     scoring_pattern: List[ScoringPattern]
 
 
-def get_chroma_client():
-    return PersistentClient(path=CHROMA_DB_PATH)
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """Wrap an embedding function with a disk-backed cache keyed by (content hash, model id)"""
 
-def get_openai_client():
-    return OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, inner: EmbeddingFunction, model_id: str, path: str, max_entries: int):
+        self.inner = inner
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, embedding BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
 
-def setup_chromadb(project_path: str) -> int:
-    """Process project files and store in ChromaDB"""
-    client = get_chroma_client()
-    collection = client.get_or_create_collection(
-        name="code_analysis",
-        embedding_function=embedding_functions.DefaultEmbeddingFunction()
+    def _key(self, document: str) -> str:
+        digest = hashlib.sha256(document.encode("utf-8", errors="surrogatepass")).hexdigest()
+        return f"{self.model_id}:{digest}"
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [self._key(document) for document in input]
+        now = time.time()
+        
+        with self._lock:
+            cached = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, embedding FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                cached.update({key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows})
+            if cached:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in cached])
+                self._conn.commit()
+        
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            computed = self.inner([input[i] for i in missing])
+            fresh = {keys[i]: np.asarray(embedding, dtype=np.float32) for i, embedding in zip(missing, computed)}
+            cached.update(fresh)
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, embedding, last_used) VALUES (?, ?, ?)",
+                    [(key, embedding.tobytes(), now) for key, embedding in fresh.items()]
+                )
+                self._evict()
+                self._conn.commit()
+        
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        return [cached[key] for key in keys]
+
+    def _evict(self):
+        """Drop least recently used entries once the cache exceeds max_entries"""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            return {
+                "model": self.model_id,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "max_entries": self.max_entries
+            }
+
+
+_embedding_function = None
+_singleton_lock = threading.Lock()
+
+def get_embedding_function() -> CachedEmbeddingFunction:
+    global _embedding_function
+    with _singleton_lock:
+        if _embedding_function is None:
+            _embedding_function = CachedEmbeddingFunction(
+                embedding_functions.DefaultEmbeddingFunction(),
+                LOCAL_EMBEDDING_MODEL,
+                EMBEDDING_CACHE_PATH,
+                EMBEDDING_CACHE_MAX_ENTRIES
+            )
+    return _embedding_function
+
+class LLMResponseCache:
+    """Two-tier (in-memory LRU + SQLite) cache of chat completions for identical inputs"""
+
+    def __init__(self, path: str, memory_entries: int, template_version: str):
+        self.memory_entries = memory_entries
+        self.template_version = template_version
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, template_version TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM responses WHERE template_version != ?", (template_version,))
+        self._conn.commit()
+
+    def key(self, prompt: str, model: str, temperature: float) -> str:
+        payload = json.dumps([self.template_version, model, temperature, prompt])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            row = self._conn.execute(
+                "SELECT content FROM responses WHERE key = ? AND template_version = ?",
+                (key, self.template_version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key: str, content: str):
+        with self._lock:
+            self._remember(key, content)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, template_version, content, created_at) VALUES (?, ?, ?, ?)",
+                (key, self.template_version, content, time.time())
+            )
+            self._conn.commit()
+
+    def _remember(self, key: str, content: str):
+        self._memory[key] = content
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            return {
+                "template_version": self.template_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "persistent_entries": entries
+            }
+
+
+_llm_cache = None
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    with _singleton_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_MEMORY_ENTRIES, PROMPT_TEMPLATE_VERSION)
+    return _llm_cache
+
+def parse_completion(content: Optional[str], required_keys: Tuple[str, ...]) -> dict:
+    """Parse a JSON completion, raising ValueError if it is empty, malformed or missing required keys"""
+    if content is None:
+        raise ValueError("Model returned no content")
+    parsed = json.loads(content)
+    if not isinstance(parsed, dict):
+        raise ValueError("Model response is not a JSON object")
+    missing = [key for key in required_keys if key not in parsed]
+    if missing:
+        raise ValueError(f"Model response is missing {', '.join(missing)}")
+    return parsed
+
+async def cached_completion(client: AsyncOpenAI, prompt: str, temperature: float, required_keys: Tuple[str, ...] = ()) -> dict:
+    """Return the parsed JSON completion for prompt, reusing a cached response for identical inputs
+
+    Only responses that parse and carry required_keys are cached, so a truncated or
+    malformed reply is retried against the API instead of being replayed.
+    """
+    cache = get_llm_cache()
+    key = cache.key(prompt, ANALYSIS_MODEL, temperature)
+    content = await asyncio.to_thread(cache.get, key)
+    if content is not None:
+        try:
+            return parse_completion(content, required_keys)
+        except ValueError as e:
+            logger.warning(f"Ignoring unusable cached completion: {e}")
+    
+    response = await client.chat.completions.create(
+        model=ANALYSIS_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        response_format={"type": "json_object"}
     )
+    content = response.choices[0].message.content
+    parsed = parse_completion(content, required_keys)
+    await asyncio.to_thread(cache.put, key, content)
+    return parsed
+
+class ResultStore:
+    """SQLite store of finished evaluations keyed by submission fingerprint and rubric"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "fingerprint TEXT NOT NULL, rubric TEXT NOT NULL, result TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (fingerprint, rubric))"
+        )
+        self._conn.commit()
+
+    def get(self, fingerprint: str, rubric: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM results WHERE fingerprint = ? AND rubric = ?",
+                (fingerprint, rubric)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, fingerprint: str, rubric: str, result: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (fingerprint, rubric, result, created_at) VALUES (?, ?, ?, ?)",
+                (fingerprint, rubric, json.dumps(result), time.time())
+            )
+            self._conn.commit()
+
+
+_result_store = None
+
+def get_result_store() -> ResultStore:
+    global _result_store
+    with _singleton_lock:
+        if _result_store is None:
+            _result_store = ResultStore(RESULT_STORE_PATH)
+    return _result_store
+
+def fingerprint_files(code_files: List[dict]) -> str:
+    """Hash the supported files' relative paths and contents, independent of zip metadata and order"""
+    entries = []
+    for f in code_files:
+        content_hash = hashlib.sha256(f['content'].encode("utf-8", errors="surrogatepass")).hexdigest()
+        entries.append(f"{f['path'].replace(os.sep, '/')}\0{content_hash}")
     
-    code_files = []
-    supported_extensions = ('.html', '.js', '.jsx', '.ts', '.tsx', '.css', '.py', '.java', '.php')
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update(entry.encode("utf-8", errors="surrogatepass"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def rubric_key(analysis_request: AnalysisRequest) -> str:
+    """Hash the rubric together with the prompt template version and model"""
+    payload = json.dumps([PROMPT_TEMPLATE_VERSION, ANALYSIS_MODEL, analysis_request.dict()], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+_chroma_client = None
+_ephemeral_client = None
+_async_openai_client = None
+
+def get_chroma_client():
+    global _chroma_client
+    with _singleton_lock:
+        if _chroma_client is None:
+            _chroma_client = PersistentClient(path=CHROMA_DB_PATH)
+    return _chroma_client
+
+def get_index_client():
+    """Client used for per-request collections, in memory unless VECTOR_STORE_BACKEND is persistent"""
+    global _ephemeral_client
+    if VECTOR_STORE_BACKEND == "persistent":
+        return get_chroma_client()
+    with _singleton_lock:
+        if _ephemeral_client is None:
+            _ephemeral_client = EphemeralClient()
+    return _ephemeral_client
+
+def get_async_openai_client():
+    global _async_openai_client
+    with _singleton_lock:
+        if _async_openai_client is None:
+            _async_openai_client = AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                    keepalive_expiry=OPENAI_KEEPALIVE_SECONDS
+                ))
+            )
+    return _async_openai_client
+
+async def close_clients():
+    """Close pooled HTTP connections held by the shared OpenAI client"""
+    global _async_openai_client
+    if _async_openai_client is not None:
+        await _async_openai_client.close()
+        _async_openai_client = None
+
+async def warm_up(readiness: dict, warnings: dict):
+    """Create the shared clients and load the models so the first request does not pay for it"""
+    steps = {
+        "chroma": lambda: get_index_client().heartbeat(),
+        "openai": get_async_openai_client,
+        "embedding_model": lambda: get_embedding_function().inner(["warm up"]),
+        "tokenizer": lambda: count_tokens("warm up")
+    }
+    for name, step in steps.items():
+        try:
+            await asyncio.to_thread(step)
+            readiness[name] = True
+            logger.info(f"Warmed up {name}")
+        except Exception as e:
+            logger.error(f"Error warming up {name}: {e}")
+    if readiness["tokenizer"] and get_tokenizer() is None:
+        warnings["tokenizer"] = f"{TOKENIZER_ENCODING} encoding unavailable, token counts are approximate (chars/4)"
+
+def create_workspace() -> str:
+    """Create an isolated scratch directory for a single request"""
+    os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+    workspace = tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=WORKSPACE_ROOT)
+    active_workspaces.add(workspace)
+    return workspace
+
+def remove_workspace(workspace: str):
+    """Remove a request's scratch directory"""
+    shutil.rmtree(workspace, ignore_errors=True)
+    active_workspaces.discard(workspace)
+
+def reap_stale_workspaces(max_age: int = WORKSPACE_TTL_SECONDS) -> int:
+    """Remove workspaces leaked by crashed requests that are older than max_age seconds
+
+    Workspaces still held by a queued or running job, or a bulk submission waiting
+    for its turn, are in active_workspaces and are skipped however old they are.
+    """
+    if not os.path.isdir(WORKSPACE_ROOT):
+        return 0
+    
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in os.scandir(WORKSPACE_ROOT):
+        if not entry.name.startswith(WORKSPACE_PREFIX) or not entry.is_dir(follow_symlinks=False):
+            continue
+        if entry.path in active_workspaces:
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    
+    if removed:
+        logger.info(f"Janitor removed {removed} stale workspaces")
+    return removed
+
+def new_collection_name() -> str:
+    """Generate a collection name scoped to a single submission"""
+    return f"{COLLECTION_PREFIX}{uuid.uuid4().hex}"
+
+def reap_stale_collections(max_age: int = COLLECTION_TTL_SECONDS) -> int:
+    """Delete per-submission collections that outlived max_age seconds"""
+    client = get_index_client()
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in client.list_collections():
+        name = getattr(entry, "name", entry)
+        if not name.startswith(COLLECTION_PREFIX) or name in _vector_indexes:
+            continue
+        try:
+            metadata = client.get_collection(name).metadata or {}
+            if metadata.get("created_at", 0) < cutoff:
+                client.delete_collection(name)
+                removed += 1
+        except Exception as e:
+            logger.error(f"Error reaping collection {name}: {e}")
+    
+    with _vector_indexes_lock:
+        stale = [name for name, index in _vector_indexes.items() if index.created_at < cutoff]
+    for name in stale:
+        drop_vector_index(name)
+        removed += 1
+    
+    if removed:
+        logger.info(f"Janitor removed {removed} stale collections")
+    return removed
+
+async def workspace_janitor():
+    """Periodically reclaim stale workspaces and collections in the background"""
+    while True:
+        try:
+            await asyncio.to_thread(reap_stale_workspaces)
+            await asyncio.to_thread(reap_stale_collections)
+            await asyncio.to_thread(reap_stale_student_indexes)
+            reap_finished_jobs()
+        except Exception as e:
+            logger.error(f"Error in workspace janitor: {e}")
+        await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+
+def gitignore_pattern_regex(pattern: str) -> str:
+    """Translate a gitignore glob to a regex: '*' and '?' stay within one path segment, '**' spans segments"""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1:end]
+            regex += "[" + ("^" + body[1:] if body.startswith("!") else body).replace("\\", "\\\\") + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class IgnoreSpec:
+    """Minimal gitignore-style matcher supporting globs, negation, anchoring and directory-only rules
+
+    A pattern with a slash at the start or in the middle is anchored to the project root;
+    one without matches a file or directory name at any depth, as does a '**/'-prefixed one.
+    """
+
+    def __init__(self, lines: List[str]):
+        self.rules = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            pattern = line[1:] if negate else line
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if not pattern:
+                continue
+            name_only = "/" not in pattern
+            regex = gitignore_pattern_regex(pattern.lstrip("/"))
+            self.rules.append((negate, dir_only, name_only, re.compile(regex)))
+
+    def extend(self, lines: List[str]) -> "IgnoreSpec":
+        spec = IgnoreSpec([])
+        spec.rules = self.rules + IgnoreSpec(lines).rules
+        return spec
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        """Return True if rel_path (posix, relative to the project root) is ignored; last matching rule wins"""
+        ignored = False
+        name = rel_path.rsplit("/", 1)[-1]
+        for negate, dir_only, name_only, regex in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(name if name_only else rel_path):
+                ignored = not negate
+        return ignored
+
+
+DEFAULT_IGNORE_SPEC = IgnoreSpec(IGNORE_PATTERNS)
+
+def decode_source(data: bytes) -> Tuple[str, str, int]:
+    """Decode file bytes with a utf-8 -> utf-8-sig -> latin-1 fallback chain, returning (text, encoding, replacements)
+
+    latin-1 never fails, so non-utf-8 files are decoded losslessly; replacements counts the
+    byte sequences that were invalid as utf-8, for the ingestion report.
+    """
+    if data.startswith(codecs.BOM_UTF8):
+        return data.decode('utf-8-sig', errors='replace'), 'utf-8-sig', 0
+    try:
+        return data.decode('utf-8'), 'utf-8', 0
+    except UnicodeDecodeError:
+        pass
+    
+    replacements = data.decode('utf-8', errors='replace').count('\ufffd')
+    return data.decode('latin-1'), 'latin-1', replacements
+
+def _read_one(rel_path: str, read: Callable[[], bytes]) -> Optional[dict]:
+    try:
+        content, encoding, replacements = decode_source(read())
+    except Exception as e:
+        logger.error(f"Error reading {rel_path}: {e}")
+        return None
+    return {
+        'path': rel_path,
+        'content': content,
+        'encoding': encoding,
+        'replacements': replacements
+    }
+
+def read_concurrently(sources: Iterable[Tuple[str, Callable[[], bytes]]]) -> Iterator[dict]:
+    """Read (path, reader) pairs on a bounded thread pool and yield decoded files as they complete"""
+    with ThreadPoolExecutor(max_workers=READ_CONCURRENCY, thread_name_prefix="reader") as pool:
+        pending = set()
+        for rel_path, read in sources:
+            pending.add(pool.submit(_read_one, rel_path, read))
+            if len(pending) >= READ_CONCURRENCY * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.result() is not None:
+                        yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result() is not None:
+                    yield future.result()
+
+def _read_bytes(file_path: str) -> bytes:
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+def walk_code_files(project_path: str, skipped: List[str], ignore_spec: IgnoreSpec = DEFAULT_IGNORE_SPEC) -> Iterator[Tuple[str, str]]:
+    """Yield (relative path, absolute path) for supported files, never descending into ignored trees"""
+    gitignore_path = os.path.join(project_path, ".gitignore")
+    if os.path.isfile(gitignore_path):
+        with open(gitignore_path, 'r', encoding='utf-8', errors='replace') as f:
+            ignore_spec = ignore_spec.extend(f.read().splitlines())
     
     
-    for root, _, files in os.walk(project_path):
+    for root, dirs, files in os.walk(project_path):
+        rel_root = os.path.relpath(root, project_path).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        kept_dirs = []
+        for directory in dirs:
+            if ignore_spec.matches(rel_root + directory, True):
+                skipped.append(rel_root + directory + "/")
+            else:
+                kept_dirs.append(directory)
+        dirs[:] = kept_dirs
+        
         for file in files:
-            if file.lower().endswith(supported_extensions):
-                file_path = os.path.join(root, file)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        
-                        rel_path = os.path.relpath(file_path, project_path)
-                        code_files.append({
-                            'path': rel_path,
-                            'content': content
-                        })
-                except Exception as e:
-                    logger.error(f"Error reading {file_path}: {e}")
+            if file.lower().endswith(SUPPORTED_EXTENSIONS):
+                if ignore_spec.matches(rel_root + file, False):
+                    skipped.append(rel_root + file)
                     continue
+                yield rel_root + file, os.path.join(root, file)
+
+def iter_code_files(project_path: str, skipped: List[str], ignore_spec: IgnoreSpec = DEFAULT_IGNORE_SPEC) -> Iterator[dict]:
+    """Stream the supported files under an extracted project directory as they are read"""
+    return read_concurrently(
+        (rel_path, lambda file_path=file_path: _read_bytes(file_path))
+        for rel_path, file_path in walk_code_files(project_path, skipped, ignore_spec)
+    )
+
+def zip_project_root(names: List[str]) -> str:
+    """Return the single top-level folder prefix shared by every member, or an empty string"""
+    top_level = {name.split("/", 1)[0] for name in names}
+    if len(top_level) != 1:
+        return ""
     
-    if not code_files:
-        return 0
+    root = top_level.pop()
+    if all(name.startswith(root + "/") for name in names):
+        return root + "/"
+    return ""
+
+def select_zip_members(
+    zip_ref: zipfile.ZipFile,
+    ignore_spec: IgnoreSpec = DEFAULT_IGNORE_SPEC
+) -> Tuple[List[zipfile.ZipInfo], str, List[str]]:
+    """Pick the supported, non-ignored members and the project root, enforcing the size budgets"""
+    infos = [info for info in zip_ref.infolist() if info.filename.strip("/")]
+    if len(infos) > MAX_ZIP_MEMBERS:
+        raise HTTPException(status_code=413, detail=f"Zip has {len(infos)} entries, limit is {MAX_ZIP_MEMBERS}")
     
+    root = zip_project_root([info.filename for info in infos])
+    try:
+        gitignore = zip_ref.read(root + ".gitignore").decode('utf-8', errors='replace')
+        ignore_spec = ignore_spec.extend(gitignore.splitlines())
+    except KeyError:
+        pass
     
-    documents = [f"{f['path']}\n{f['content']}" for f in code_files]
-    metadatas = [{"path": f["path"]} for f in code_files]
-    ids = [f"id_{i}" for i in range(len(code_files))]
     
-    try:
+    selected = []
+    skipped = []
+    ignored_dirs = {}
+    for info in infos:
+        if info.is_dir() or not info.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            continue
+        rel_path = info.filename[len(root):]
+        parts = rel_path.split("/")
+        if any(part in ("", "..") for part in parts[:-1]):
+            continue
+        
+        pruned = False
+        for depth in range(1, len(parts)):
+            directory = "/".join(parts[:depth])
+            if directory not in ignored_dirs:
+                ignored_dirs[directory] = ignore_spec.matches(directory, True)
+            if ignored_dirs[directory]:
+                pruned = True
+                break
+        if pruned:
+            continue
+        if ignore_spec.matches(rel_path, False):
+            skipped.append(rel_path)
+            continue
+        selected.append(info)
+    
+    skipped.extend(
+        directory + "/" for directory, ignored in ignored_dirs.items()
+        if ignored and not any(ignored_dirs.get(parent) for parent in _parent_dirs(directory))
+    )
+    
+    total_bytes = sum(info.file_size for info in selected)
+    if total_bytes > MAX_EXTRACT_BYTES:
+        raise HTTPException(status_code=413, detail=f"Code files total {total_bytes} bytes, limit is {MAX_EXTRACT_BYTES}")
+    return selected, root, sorted(skipped)
+
+def _parent_dirs(directory: str) -> List[str]:
+    parts = directory.split("/")
+    return ["/".join(parts[:depth]) for depth in range(1, len(parts))]
+
+def iter_zip_code_files(zip_source, skipped: List[str]) -> Iterator[dict]:
+    """Stream the supported members straight from the zip, decoded in memory, as they are read"""
+    with zipfile.ZipFile(zip_source, 'r') as zip_ref:
+        infos, root, zip_skipped = select_zip_members(zip_ref)
+        skipped.extend(zip_skipped)
+        yield from read_concurrently(
+            (info.filename[len(root):], lambda info=info: zip_ref.read(info))
+            for info in infos
+        )
+
+class LibraryIndex:
+    """Recognise vendored copies of common front-end libraries
+
+    Exact matches come from LIBRARY_INDEX_PATH, a JSON object mapping the sha256 of a
+    library file's normalised content to {"name": ..., "version": ...}; build it with
+    build_library_index.py. Files that are not in the index fall back to version-agnostic
+    header signatures, which only count when the file is also named like the library's
+    distribution file or looks minified, so hand-written code that mentions a library
+    in its opening comment is kept.
+    """
+
+    def __init__(self, path: str, signatures: List[Tuple[str, str, str]]):
+        self.hashes = {}
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.hashes = json.load(f)
+        self.signatures = [
+            (name, re.compile(pattern, re.IGNORECASE | re.DOTALL), re.compile(file_pattern, re.IGNORECASE))
+            for name, pattern, file_pattern in signatures
+        ]
+
+    @staticmethod
+    def content_hash(content: str) -> str:
+        normalised = "\n".join(line.rstrip() for line in content.replace("\r\n", "\n").strip().split("\n"))
+        return hashlib.sha256(normalised.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+    def match_signature(self, content: str, path: str = None) -> Optional[Tuple[str, str]]:
+        """Return (library name, version) from a license header, requiring a matching file name if path is given"""
+        header = content[:3000]
+        if not header.lstrip().startswith(("/*", "//", "!function", "(function")):
+            return None
+        for name, pattern, file_pattern in self.signatures:
+            match = pattern.search(header)
+            if match and (path is None or file_pattern.search(os.path.basename(path))):
+                return name, next((group for group in match.groups() if group), "")
+        return None
+
+    def identify(self, path: str, content: str) -> Optional[Tuple[str, str]]:
+        """Return (library name, version) if content is a known library file"""
+        entry = self.hashes.get(self.content_hash(content))
+        if entry:
+            return entry["name"], entry.get("version", "")
+        if len(content) < LIBRARY_SIGNATURE_MIN_CHARS:
+            return None
         
-        collection.delete(ids=ids)
+        return self.match_signature(content, path) or (
+            self.match_signature(content) if classify_generated(path, content) else None
+        )
+
+
+_library_index = None
+
+def get_library_index() -> LibraryIndex:
+    global _library_index
+    with _singleton_lock:
+        if _library_index is None:
+            _library_index = LibraryIndex(LIBRARY_INDEX_PATH, KNOWN_LIBRARY_SIGNATURES)
+    return _library_index
+
+def library_evidence(libraries: List[dict]) -> str:
+    """Summarise vendored libraries as one line each for the prompt"""
+    return "\n".join(
+        f"- uses library {lib['library']} v{lib['version']} ({lib['path']})" if lib['version']
+        else f"- uses library {lib['library']} ({lib['path']})"
+        for lib in libraries
+    )
+
+def classify_generated(path: str, content: str) -> Optional[str]:
+    """Return why a file looks minified, generated or bundled, or None for hand-written code"""
+    if GENERATED_NAME_PATTERN.search(path):
+        return "generated file name"
+    
+    sample = content[:GENERATED_SAMPLE_CHARS]
+    header = sample[:1000]
+    for marker in GENERATED_HEADER_MARKERS:
+        if marker in header:
+            return f"generated header ({marker.strip()})"
+    sample = GENERATED_EMBEDDED_DATA_PATTERN.sub("data:", sample)  # inline base64 images are not minified code
+    if len(sample) < 2048:
+        return None
+    
+    
+    long_line_chars = sum(len(line) for line in sample.splitlines() if len(line) > GENERATED_MAX_LINE_LENGTH)
+    if long_line_chars / len(sample) > GENERATED_MAX_LONG_LINE_SHARE:
+        return "very long lines"
+    whitespace = sum(1 for char in sample if char.isspace())
+    if whitespace / len(sample) < GENERATED_MIN_WHITESPACE_RATIO:
+        return "almost no whitespace"
+    counts = Counter(sample)
+    entropy = -sum((n / len(sample)) * math.log2(n / len(sample)) for n in counts.values())
+    if entropy > GENERATED_MAX_ENTROPY:
+        return f"high character entropy ({entropy:.2f} bits)"
+    return None
+
+def new_filter_report() -> dict:
+    return {"libraries": [], "generated": [], "decoding": []}
+
+def iter_filtered_code_files(code_files: Iterable[dict], report: dict) -> Iterator[dict]:
+    """Classify files as they stream in, yielding hand-written ones and recording the rest in report"""
+    index = get_library_index()
+    for f in code_files:
+        if f.get('encoding', 'utf-8') != 'utf-8' or f.get('replacements'):
+            report["decoding"].append({"path": f['path'], "encoding": f['encoding'], "replacements": f['replacements']})
+        
+        match = index.identify(f['path'], f['content'])
+        if match:
+            name, version = match
+            report["libraries"].append({"path": f['path'], "library": name, "version": version})
+            continue
+        reason = classify_generated(f['path'], f['content'])
+        if reason:
+            report["generated"].append({"path": f['path'], "reason": reason, "size": len(f['content'])})
+            continue
+        yield f
+
+def filter_code_files(code_files: Iterable[dict]) -> Tuple[List[dict], dict]:
+    """Drop vendored libraries and minified or generated files, returning the rest sorted by path"""
+    report = new_filter_report()
+    kept = list(iter_filtered_code_files(code_files, report))
+    kept.sort(key=lambda f: f['path'])
+    for entries in report.values():
+        entries.sort(key=lambda entry: entry['path'])
+    return kept, report
+
+def _python_boundaries(lines: List[str]) -> List[int]:
+    tree = ast.parse("\n".join(lines))
+    boundaries = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            boundaries.append(start - 1)
+            if node.end_lineno < len(lines):
+                boundaries.append(node.end_lineno)
+    return boundaries
+
+def _brace_boundaries(lines: List[str], nested_functions: bool) -> List[int]:
+    """Lines starting a top-level statement or rule (brace depth 0), optionally also nested function starts"""
+    boundaries = []
+    depth = 0
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped and (depth == 0 or (nested_functions and depth == 1 and FUNCTION_START_PATTERN.match(line))):
+            boundaries.append(i)
+        depth = max(0, depth + line.count("{") - line.count("}"))
+    return boundaries
+
+def chunk_boundaries(path: str, lines: List[str]) -> List[int]:
+    """Return the line indices where a chunk may start, following the file's syntax"""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == ".py":
+            return _python_boundaries(lines)
+        if extension in (".js", ".jsx", ".ts", ".tsx", ".java", ".php"):
+            return _brace_boundaries(lines, nested_functions=True)
+        if extension == ".css":
+            return _brace_boundaries(lines, nested_functions=False)
+        if extension == ".html":
+            return [i for i, line in enumerate(lines) if HTML_SECTION_PATTERN.match(line)]
+    except SyntaxError:
+        pass
+    return [i + 1 for i, line in enumerate(lines) if not line.strip()]
+
+def chunk_code_file(code_file: dict, max_chars: int = CHUNK_MAX_CHARS) -> List[dict]:
+    """Split a file along syntactic boundaries into chunks of at most max_chars, with 1-based line ranges"""
+    lines = code_file['content'].split("\n")
+    starts = sorted({0} | {b for b in chunk_boundaries(code_file['path'], lines) if 0 < b < len(lines)})
+    segments = [(start, end) for start, end in zip(starts, starts[1:] + [len(lines)])]
+    
+    
+    pieces = []
+    for start, end in segments:
+        size = 0
+        piece_start = start
+        for i in range(start, end):
+            if size and size + len(lines[i]) + 1 > max_chars:
+                pieces.append((piece_start, i))
+                piece_start, size = i, 0
+            size += len(lines[i]) + 1
+        pieces.append((piece_start, end))
+    
+    
+    chunks = []
+    chunk_start, chunk_end, size = pieces[0][0], pieces[0][0], 0
+    for start, end in pieces:
+        piece_size = sum(len(line) + 1 for line in lines[start:end])
+        if size and size + piece_size > max_chars:
+            chunks.append((chunk_start, chunk_end))
+            chunk_start, size = start, 0
+        chunk_end = end
+        size += piece_size
+    chunks.append((chunk_start, chunk_end))
+    
+    return [
+        {
+            'path': code_file['path'],
+            'start_line': start + 1,
+            'end_line': end,
+            'content': "\n".join(lines[start:end])
+        }
+        for start, end in chunks
+        if "\n".join(lines[start:end]).strip()
+    ]
+
+def lexical_tokens(text: str) -> List[str]:
+    """Code-aware tokens: identifiers and tag names, also split on camelCase and snake_case, lowercased"""
+    tokens = []
+    for word in re.findall(r"[A-Za-z_$][A-Za-z0-9_$]*", text):
+        parts = [p for p in re.split(r"[_$]+|(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])", word) if p]
+        for token in {word, *parts} if len(parts) > 1 else {word}:
+            token = token.lower()
+            if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+                token = token[:-1]
+            if len(token) > 1 and token not in LEXICAL_STOP_WORDS:
+                tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """In-process inverted index scored with Okapi BM25"""
+
+    def __init__(self):
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.lengths = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[dict]):
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            position = len(self.ids)
+            tokens = lexical_tokens(document.partition("\n")[2])  # skip the 'path:start-end' header line
+            for token, frequency in Counter(tokens).items():
+                self.postings.setdefault(token, {})[position] = frequency
+            self.ids.append(chunk_id)
+            self.documents.append(document)
+            self.metadatas.append(metadata)
+            self.lengths.append(len(tokens))
+
+    def query(self, query_texts: List[str], n_results: int) -> dict:
+        result = {"ids": [], "documents": [], "metadatas": [], "scores": []}
+        total = len(self.ids)
+        average_length = (sum(self.lengths) / total) if total else 0.0
+        for text in query_texts:
+            scores = Counter()
+            for token in set(lexical_tokens(text)):
+                postings = self.postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for position, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / max(average_length, 1e-9))
+                    scores[position] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+            top = scores.most_common(n_results)
+            result["ids"].append([self.ids[i] for i, _ in top])
+            result["documents"].append([self.documents[i] for i, _ in top])
+            result["metadatas"].append([self.metadatas[i] for i, _ in top])
+            result["scores"].append([score for _, score in top])
+        return result
+
+
+class VectorIndex(ABC):
+    """Per-submission vector index with a BM25 index alongside; query() returns Chroma-style nested result lists"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.created_at = time.time()
+        self.lexical = BM25Index()
+
+    @abstractmethod
+    def add(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings=None):
+        ...
+
+    @abstractmethod
+    def query(self, query_texts: List[str] = None, n_results: int = 10, query_embeddings=None) -> dict:
+        ...
+
+    @abstractmethod
+    def embeddings(self, ids: List[str]) -> np.ndarray:
+        """Stored embeddings for ids, one row per id in the given order"""
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    def max_batch_size(self) -> int:
+        return INDEX_BATCH_SIZE
+
+    def delete(self):
+        pass
+
+
+class ChromaVectorIndex(VectorIndex):
+    """Index backed by a collection on the per-request Chroma client"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.collection = get_index_client().get_or_create_collection(
+            name=name,
+            embedding_function=get_embedding_function(),
+            metadata={"created_at": self.created_at}
+        )
+
+    def add(self, ids, documents, metadatas, embeddings=None):
+        self.collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def query(self, query_texts=None, n_results=10, query_embeddings=None):
+        if query_embeddings is not None:
+            return self.collection.query(query_embeddings=query_embeddings, n_results=n_results)
+        return self.collection.query(query_texts=query_texts, n_results=n_results)
+
+    def embeddings(self, ids):
+        stored = self.collection.get(ids=ids, include=["embeddings"])
+        rows = dict(zip(stored["ids"], stored["embeddings"]))
+        return np.asarray([rows[chunk_id] for chunk_id in ids], dtype=np.float32)
+
+    def count(self):
+        return self.collection.count()
+
+    def max_batch_size(self):
+        return min(INDEX_BATCH_SIZE, get_index_client().get_max_batch_size())
+
+    def delete(self):
+        get_index_client().delete_collection(self.name)
+
+
+class NumpyVectorIndex(VectorIndex):
+    """Exact cosine search over an in-process matrix of normalised embeddings"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self._blocks = []
+        self._matrix = None
+
+    @staticmethod
+    def _normalise(embeddings) -> np.ndarray:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def add(self, ids, documents, metadatas, embeddings=None):
+        if embeddings is None:
+            embeddings = get_embedding_function()(documents)
+        self._blocks.append(self._normalise(embeddings))
+        self._matrix = None
+        self.ids.extend(ids)
+        self.documents.extend(documents)
+        self.metadatas.extend(metadatas)
+
+    def query(self, query_texts=None, n_results=10, query_embeddings=None):
+        if query_embeddings is None:
+            query_embeddings = get_embedding_function()(query_texts)
+        queries = self._normalise(query_embeddings)
+        k = min(n_results, self.count())
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if k == 0:
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
         
         
-        collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
+        distances = 1.0 - queries @ self.matrix.T
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        for row, indices in enumerate(top):
+            result["ids"].append([self.ids[i] for i in indices])
+            result["documents"].append([self.documents[i] for i in indices])
+            result["metadatas"].append([self.metadatas[i] for i in indices])
+            result["distances"].append(distances[row, indices].tolist())
+        return result
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = np.concatenate(self._blocks) if len(self._blocks) > 1 else self._blocks[0]
+            self._blocks = [self._matrix]
+        return self._matrix
+
+    def embeddings(self, ids):
+        positions = {chunk_id: position for position, chunk_id in enumerate(self.ids)}
+        return self.matrix[[positions[chunk_id] for chunk_id in ids]]
+
+    def count(self):
+        return len(self.ids)
+
+
+def student_collection_name(student_id: str) -> str:
+    """Persistent collection for a student, versioned by embedding model and chunk size"""
+    key = f"{student_id}|{LOCAL_EMBEDDING_MODEL}|{CHUNK_MAX_CHARS}"
+    return f"{STUDENT_COLLECTION_PREFIX}{hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]}"
+
+
+class StudentVectorIndex(ChromaVectorIndex):
+    """A student's persistent collection, upserted in place across resubmissions"""
+
+    def __init__(self, name: str, student_id: str):
+        VectorIndex.__init__(self, name)
+        self.collection = get_chroma_client().get_or_create_collection(
+            name=student_collection_name(student_id),
+            embedding_function=get_embedding_function(),
+            metadata={"updated_at": self.created_at}
         )
-        logger.info(f"Added {len(code_files)} documents to ChromaDB")
-        return len(code_files)
+
+    def add(self, ids, documents, metadatas, embeddings=None):
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def max_batch_size(self):
+        return min(INDEX_BATCH_SIZE, get_chroma_client().get_max_batch_size())
+
+    def existing_chunks(self) -> Dict[str, dict]:
+        stored = self.collection.get(include=["metadatas"])
+        return dict(zip(stored["ids"], stored["metadatas"]))
+
+    def remove(self, ids: List[str]):
+        for start in range(0, len(ids), self.max_batch_size()):
+            self.collection.delete(ids=ids[start:start + self.max_batch_size()])
+
+    def touch(self):
+        self.collection.modify(metadata={"updated_at": time.time()})
+
+    def delete(self):
+        pass  # kept for the student's next resubmission
+
+
+_vector_indexes: Dict[str, VectorIndex] = {}
+_vector_indexes_lock = threading.Lock()
+_student_locks: Dict[str, threading.Lock] = {}
+
+def create_vector_index(name: str, document_count: int) -> VectorIndex:
+    """Create and register an index, picking NumPy for small corpora unless a backend is forced"""
+    backend = VECTOR_INDEX_BACKEND
+    if backend == "auto":
+        backend = "numpy" if document_count <= NUMPY_INDEX_MAX_DOCUMENTS else "chroma"
+    return register_vector_index(NumpyVectorIndex(name) if backend == "numpy" else ChromaVectorIndex(name))
+
+def register_vector_index(index: VectorIndex) -> VectorIndex:
+    with _vector_indexes_lock:
+        _vector_indexes[index.name] = index
+    return index
+
+def get_vector_index(name: str) -> VectorIndex:
+    with _vector_indexes_lock:
+        return _vector_indexes[name]
+
+def drop_vector_index(name: str):
+    with _vector_indexes_lock:
+        index = _vector_indexes.pop(name, None)
+    if index is not None:
+        index.delete()
+
+def student_lock(student_collection: str) -> threading.Lock:
+    """Lock guarding one student's persistent collection"""
+    with _vector_indexes_lock:
+        return _student_locks.setdefault(student_collection, threading.Lock())
+
+def sync_student_index(code_files: List[dict], student_id: str, collection_name: str, stats: dict = None) -> int:
+    """Bring the student's persistent collection in line with this submission, embedding only changed files
+
+    Chunk ids are '<path hash>-<content hash>-<n>', so files unchanged since the previous
+    submission keep their ids and are skipped; chunks of removed or modified files are deleted.
+    A file counts as unchanged only when all of its file_chunks chunks are stored, so one left
+    half-indexed by a failed sync is embedded again. Returns 0 if indexing the changed files fails.
+    The caller must hold student_lock for the student's collection.
+    """
+    stats = stats if stats is not None else {}
+    index = register_vector_index(StudentVectorIndex(collection_name, student_id))
+    existing = index.existing_chunks()
+    stored_counts = Counter(chunk_id.rsplit("-", 1)[0] for chunk_id in existing)
+    expected_counts = {chunk_id.rsplit("-", 1)[0]: (metadata or {}).get("file_chunks") for chunk_id, metadata in existing.items()}
+    existing_keys = {key for key, count in stored_counts.items() if count == expected_counts[key]}
+    wanted = {file_key(f): f for f in code_files}
+    stale = [chunk_id for chunk_id in existing if chunk_id.rsplit("-", 1)[0] not in wanted]
+    changed = [f for key, f in wanted.items() if key not in existing_keys]
+    
+    if stale:
+        index.remove(stale)
+    if changed and index_code_files(changed, collection_name, stats, index=index) == 0:
+        logger.error(f"Failed to sync student index {collection_name}: {len(changed)} changed files not indexed")
+        return 0
+    index.touch()
+    
+    
+    unchanged = [f for key, f in wanted.items() if key in existing_keys]
+    records = list(iter_chunk_records(unchanged))
+    if records:
+        ids, documents, metadatas = (list(column) for column in zip(*records))
+        index.lexical.add(ids, documents, metadatas)
+    
+    stats.update({"changed_files": len(changed), "reused_files": len(code_files) - len(changed), "removed_chunks": len(stale)})
+    logger.info(f"Synced student index: {len(changed)} changed files, {len(stale)} stale chunks removed")
+    return len(code_files)
+
+def sync_and_retrieve_student_context(
+    code_files: List[dict],
+    student_id: str,
+    collection_name: str,
+    analysis_request: AnalysisRequest,
+    stats: dict = None
+) -> Tuple[int, List[dict]]:
+    """Sync the student's collection and retrieve from it under one lock, so a concurrent resubmission cannot change it in between"""
+    with student_lock(student_collection_name(student_id)):
+        file_count = sync_student_index(code_files, student_id, collection_name, stats)
+        if file_count == 0:
+            return 0, []
+        return file_count, retrieve_context_items(collection_name, analysis_request)
+
+def reap_stale_student_indexes(max_age: int = STUDENT_INDEX_TTL_SECONDS) -> int:
+    """Delete student collections that have not been resubmitted to for max_age seconds"""
+    client = get_chroma_client()
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in client.list_collections():
+        name = getattr(entry, "name", entry)
+        if not name.startswith(STUDENT_COLLECTION_PREFIX):
+            continue
+        try:
+            with student_lock(name):
+                metadata = client.get_collection(name).metadata or {}
+                if metadata.get("updated_at", 0) < cutoff:
+                    client.delete_collection(name)
+                    removed += 1
+        except Exception as e:
+            logger.error(f"Error reaping student collection {name}: {e}")
+    
+    if removed:
+        logger.info(f"Janitor removed {removed} stale student collections")
+    return removed
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process since it started, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+def current_rss_mb() -> Optional[float]:
+    """Current resident set size of this process in MB, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def file_key(code_file: dict) -> str:
+    """Stable id prefix for a file, derived from its path and content hash"""
+    path_hash = hashlib.sha1(code_file['path'].encode('utf-8', errors='surrogatepass')).hexdigest()[:16]
+    content_hash = hashlib.sha256(code_file['content'].encode('utf-8', errors='surrogatepass')).hexdigest()[:16]
+    return f"{path_hash}-{content_hash}"
+
+def iter_chunk_records(code_files: Iterable[dict]) -> Iterator[Tuple[str, str, dict]]:
+    """Chunk files lazily, yielding (stable chunk id, document, metadata)"""
+    for f in code_files:
+        key = file_key(f)
+        chunks = chunk_code_file(f)
+        for position, c in enumerate(chunks):
+            yield (
+                f"{key}-{position}",
+                f"{c['path']}:{c['start_line']}-{c['end_line']}\n{c['content']}",
+                {"path": c["path"], "start_line": c["start_line"], "end_line": c["end_line"], "file_chunks": len(chunks)}
+            )
+
+def index_code_files(
+    code_files: Iterable[dict],
+    collection_name: str,
+    stats: dict = None,
+    index: VectorIndex = None
+) -> int:
+    """Stream code files into the submission's vector index in size-limited batches
+
+    Chunks are built and inserted one batch at a time, so at most one batch of documents
+    is held alongside the files. Batches are capped by the store's max batch size and
+    INDEX_BATCH_MAX_CHARS. Chunks go into index if given, otherwise into a new index
+    registered under collection_name. Per-batch latency, the change in RSS over the call and
+    the process-wide peak RSS are written to stats.
+    """
+    stats = stats if stats is not None else {}
+    stats.update({"batches": [], "chunks": 0, "files": 0})
+    rss_before = current_rss_mb()
+    expected_chunks = (
+        sum(len(f['content']) // CHUNK_MAX_CHARS + 1 for f in code_files)
+        if isinstance(code_files, list) else 0
+    )
+    batch = {"ids": [], "documents": [], "metadatas": []}
+    batch_chars = 0
+
+    def flush():
+        nonlocal index, batch, batch_chars
+        if not batch["ids"]:
+            return
+        if index is None:
+            index = create_vector_index(collection_name, expected_chunks)
+        start = time.perf_counter()
+        index.add(**batch)
+        index.lexical.add(**batch)
+        stats["batches"].append({"size": len(batch["ids"]), "ms": round((time.perf_counter() - start) * 1000, 2)})
+        batch = {"ids": [], "documents": [], "metadatas": []}
+        batch_chars = 0
+    
+    try:
+        def counted(files):
+            for f in files:
+                stats["files"] += 1
+                yield f
+        
+        for chunk_id, document, metadata in iter_chunk_records(counted(code_files)):
+            if batch["ids"] and (
+                len(batch["ids"]) >= (index.max_batch_size() if index else INDEX_BATCH_SIZE)
+                or batch_chars + len(document) > INDEX_BATCH_MAX_CHARS
+            ):
+                flush()
+            batch["ids"].append(chunk_id)
+            batch["documents"].append(document)
+            batch["metadatas"].append(metadata)
+            batch_chars += len(document)
+            stats["chunks"] += 1
+        flush()
     except Exception as e:
-        logger.error(f"Error adding to ChromaDB: {e}")
+        logger.error(f"Error adding to vector index: {e}")
+        return 0
+    
+    rss_after = current_rss_mb()
+    if rss_before is not None and rss_after is not None:
+        stats["rss_delta_mb"] = round(rss_after - rss_before, 1)
+    stats["process_peak_rss_mb"] = round(peak_rss_mb(), 1)
+    if index is None:
         return 0
+    logger.info(f"Added {stats['chunks']} chunks from {stats['files']} files to {type(index).__name__} in {len(stats['batches'])} batches")
+    return stats["files"]
+
+_tokenizer = None
+
+def get_tokenizer():
+    """Load the GPT-4.1 tokenizer, or None if its encoding file is unavailable (e.g. offline)"""
+    global _tokenizer
+    with _singleton_lock:
+        if _tokenizer is None:
+            try:
+                _tokenizer = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                logger.warning(f"Falling back to approximate token counts: {e}")
+                _tokenizer = False
+    return _tokenizer or None
+
+def count_tokens(text: str) -> int:
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(tokenizer.encode(text, disallowed_special=()))
+
+def truncate_head_tail(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of text within max_tokens, marking the omitted middle"""
+    lines = text.split("\n")
+    head, tail = [], []
+    used = count_tokens("\n... [truncated 00000 lines] ...\n")
+    i, j = 0, len(lines) - 1
+    while i <= j:
+        take_head = len(head) <= 2 * len(tail)
+        line = lines[i] if take_head else lines[j]
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        used += cost
+        if take_head:
+            head.append(line)
+            i += 1
+        else:
+            tail.append(line)
+            j -= 1
+    omitted = j - i + 1
+    if omitted <= 0:
+        return text
+    return "\n".join(head + [f"... [truncated {omitted} lines] ..."] + tail[::-1])
+
+def render_context_block(item: dict, content: str) -> str:
+    return f"=== FILE: {item['path']} (lines {item.get('start_line', '?')}-{item.get('end_line', '?')}) ===\n{content}"
+
+def pack_context(items: List[dict], budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, dict]:
+    """Fill the token budget greedily by relevance per token, truncating oversized items head/tail
+
+    Each item needs 'path' and 'content', and may carry 'start_line', 'end_line' and
+    'relevance' (higher is better). Returns the context and a report of what was
+    included, truncated or dropped.
+    """
+    for item in items:
+        item['tokens'] = count_tokens(render_context_block(item, item['content']))
+    ranked = sorted(items, key=lambda item: item.get('relevance', 1.0) / max(item['tokens'], 1), reverse=True)
+    
+    
+    remaining = budget
+    packed = []
+    report = {"budget": budget, "used_tokens": 0, "included": [], "truncated": [], "dropped": []}
+    for item in ranked:
+        label = f"{item['path']}:{item.get('start_line', 1)}-{item.get('end_line', '?')}"
+        if item['tokens'] <= remaining:
+            packed.append((item, item['content']))
+            remaining -= item['tokens']
+            report["included"].append(label)
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            header_tokens = count_tokens(render_context_block(item, ""))
+            content = truncate_head_tail(item['content'], remaining - header_tokens)
+            packed.append((item, content))
+            remaining -= count_tokens(render_context_block(item, content))
+            report["truncated"].append(label)
+        else:
+            report["dropped"].append(label)
+    
+    packed.sort(key=lambda entry: (entry[0]['path'], entry[0].get('start_line', 0)))
+    report["used_tokens"] = budget - remaining
+    return "\n\n".join(render_context_block(item, content) for item, content in packed), report
 
 def generate_scoring_prompt_section(scoring_pattern: List[ScoringPattern]) -> str:
     """Generate the scoring section of the prompt"""
@@ -114,20 +1520,138 @@ def generate_scoring_prompt_section(scoring_pattern: List[ScoringPattern]) -> st
     prompt_section += "\nEvaluate each component and deduct points for missing or incomplete features."
     return prompt_section
 
-def analyze_with_ai(project_path: str, analysis_request: AnalysisRequest) -> dict:
-    """Analyze the project using OpenAI with two-phase validation"""
-    client = get_openai_client()
-    collection = get_chroma_client().get_collection("code_analysis")
+def retrieval_queries(analysis_request: AnalysisRequest) -> List[Tuple[str, str, str]]:
+    """(label, vector query, lexical query) triples: one per scoring component, plus the problem statement and technology
+
+    The lexical side gets the bare component text, since technology words such as 'JS'
+    would match every chunk; the technology query is vector-only.
+    """
+    queries = [
+        (item.component, f"{item.component} ({analysis_request.technology})", item.component)
+        for item in analysis_request.scoring_pattern
+    ]
+    queries.append(("problem statement", analysis_request.problem_statement, analysis_request.problem_statement))
+    queries.append(("technology", analysis_request.technology, ""))
+    return queries
+
+def query_code_context(collection_name: str, query_texts: List[str]) -> dict:
+    """Run one batched multi-query against the submission's index"""
+    index = get_vector_index(collection_name)
+    return index.query(
+        query_texts=query_texts,
+        n_results=min(RETRIEVAL_N_RESULTS, index.count()))
+
+def retrieve_context_items(collection_name: str, analysis_request: AnalysisRequest) -> List[dict]:
+    """Retrieve chunks per rubric component and merge them, keeping which components each one is evidence for
+
+    Each query runs against both the vector index and the BM25 index; the two rankings are
+    combined with reciprocal-rank fusion, scaled so a chunk ranked first by both scores 2.
+    """
+    queries = retrieval_queries(analysis_request)
+    vector_results = query_code_context(collection_name, [vector_text for _, vector_text, _ in queries])
+    lexical_results = get_vector_index(collection_name).lexical.query([lexical_text for _, _, lexical_text in queries], LEXICAL_N_RESULTS)
+    
+    
+    merged = {}
+    for position, (label, _, _) in enumerate(queries):
+        fused = Counter()
+        for results in (vector_results, lexical_results):
+            for rank, (chunk_id, doc, meta) in enumerate(zip(
+                results['ids'][position], results['documents'][position], results['metadatas'][position]
+            )):
+                fused[chunk_id] += (RRF_K + 1) / (RRF_K + rank + 1)
+                merged.setdefault(chunk_id, {**meta, 'content': doc, 'relevance': 0.0, 'evidence_for': {}})
+        
+        for chunk_id, score in fused.items():
+            item = merged[chunk_id]
+            item['relevance'] = max(item['relevance'], score)
+            item['evidence_for'][label] = max(item['evidence_for'].get(label, 0.0), score)
+    
+    if len(merged) < 2:
+        return list(merged.values())
+    ids = list(merged)
+    return diversify_context_items([merged[chunk_id] for chunk_id in ids], get_vector_index(collection_name).embeddings(ids))
+
+def diversify_context_items(items: List[dict], embeddings: np.ndarray, mmr_lambda: float = MMR_LAMBDA) -> List[dict]:
+    """Re-rank retrieved chunks by maximal marginal relevance so near-duplicates stop competing for the budget
+
+    Greedily picks the item maximising lambda * relevance - (1 - lambda) * max cosine similarity
+    to the items already picked. Each item's 'relevance' becomes its score at the moment it was
+    picked, shifted into [0, 1]; items nearly identical to an earlier pick are dropped and their
+    'evidence_for' scores handed to that pick.
+    """
+    vectors = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    relevance = np.array([item['relevance'] for item in items], dtype=np.float32)
+    relevance = (relevance - relevance.min()) / max(float(relevance.max() - relevance.min()), 1e-12)
+    
     
+    max_similarity = np.zeros(len(items), dtype=np.float32)
+    closest = np.full(len(items), -1)
+    remaining = np.ones(len(items), dtype=bool)
+    selected = []
+    while remaining.any():
+        scores = mmr_lambda * relevance + (1 - mmr_lambda) * (1 - max_similarity)
+        choice = int(np.argmax(np.where(remaining, scores, -np.inf)))
+        remaining[choice] = False
+        item = items[choice]
+        if selected and max_similarity[choice] >= MMR_DUPLICATE_SIMILARITY:
+            kept = items[closest[choice]]
+            for label, score in item['evidence_for'].items():
+                kept['evidence_for'][label] = max(kept['evidence_for'].get(label, 0.0), score)
+            continue
+        
+        item['relevance'] = float(scores[choice])
+        selected.append(item)
+        closer = similarity[:, choice] > max_similarity
+        max_similarity = np.where(closer, similarity[:, choice], max_similarity)
+        closest = np.where(closer, choice, closest)
     
-    results = collection.query(
-        query_texts=["Show me all important code files"],
-        n_results=min(40, collection.count()))
+    if len(selected) < len(items):
+        logger.info(f"Dropped {len(items) - len(selected)} near-duplicate chunks from the context")
+    return selected
+
+def retrieval_evidence(context_items: List[dict]) -> Dict[str, List[str]]:
+    """Map each rubric component to its best-scoring chunks, ranked by that component's own fused score"""
+    scored = {}
+    for item in context_items:
+        for label, score in item.get('evidence_for', {}).items():
+            scored.setdefault(label, []).append((score, f"{item['path']}:{item.get('start_line', 1)}-{item.get('end_line', '?')}"))
+    return {
+        label: [location for _, location in sorted(entries, key=lambda entry: entry[0], reverse=True)[:RETRIEVAL_EVIDENCE_PER_COMPONENT]]
+        for label, entries in scored.items()
+    }
+
+def whole_file_context_items(code_files: List[dict]) -> List[dict]:
+    """Use every file in full as context, for projects small enough to skip retrieval"""
+    return [
+        {'path': f['path'], 'start_line': 1, 'end_line': f['content'].count("\n") + 1, 'content': f['content'], 'relevance': 1.0}
+        for f in code_files
+    ]
+
+def is_small_project(code_files: List[dict], threshold: int = SMALL_PROJECT_TOKEN_THRESHOLD) -> bool:
+    """Check whether the whole project fits under the token threshold, stopping early once it does not"""
+    total = 0
+    for f in code_files:
+        total += count_tokens(f['content'])
+        if total > threshold:
+            return False
+    return True
+
+async def analyze_with_ai(analysis_request: AnalysisRequest, context_items: List[dict], libraries: List[dict] = None) -> dict:
+    """Analyze the project using OpenAI with two-phase validation"""
+    client = get_async_openai_client()
     
-    context = "\n\n".join([
-        f"=== FILE: {meta['path']} ===\n{doc}"
-        for doc, meta in zip(results['documents'][0], results['metadatas'][0])
-    ])
+    
+    context, packing = await asyncio.to_thread(pack_context, context_items)
+    if libraries:
+        context += f"\n\n=== VENDORED LIBRARIES (contents omitted) ===\n{library_evidence(libraries)}"
+    evidence = await asyncio.to_thread(retrieval_evidence, context_items)
+    if evidence:
+        packing["evidence"] = evidence
+        context += "\n\n=== RETRIEVAL EVIDENCE (most relevant code per component) ===\n" + "\n".join(
+            f"- {label}: {', '.join(locations)}" for label, locations in evidence.items()
+        )
     
     
     phase1_prompt = f"""
@@ -153,21 +1677,15 @@ def analyze_with_ai(project_path: str, analysis_request: AnalysisRequest) -> dic
     - Be extremely strict - any doubt means failure
     """
     
-    phase1_response = client.chat.completions.create(
-        model="gpt-4.1",
-        messages=[{"role": "user", "content": phase1_prompt}],
-        temperature=0.0,
-        response_format={"type": "json_object"}
-    )
-    
-    validation = json.loads(phase1_response.choices[0].message.content)
+    validation = await cached_completion(client, phase1_prompt, temperature=0.0, required_keys=("pass",))
     
     if not validation["pass"]:
         return {
             "status": "rejected",
-            "reasons": validation["reasons"],
+            "reasons": validation.get("reasons", []),
             "error_locations": validation.get("error_locations", []),
-            "score": 0
+            "score": 0,
+            "context": packing
         }
     
     
@@ -204,117 +1722,407 @@ def analyze_with_ai(project_path: str, analysis_request: AnalysisRequest) -> dic
     }}
     """
     
-    phase2_response = client.chat.completions.create(
-        model="gpt-4.1",
-        messages=[{"role": "user", "content": phase2_prompt}],
-        temperature=0.1,
-        response_format={"type": "json_object"}
+    evaluation = await cached_completion(
+        client, phase2_prompt, temperature=0.1, required_keys=("score", "component_evaluations", "overall_feedback")
     )
     
-    evaluation = json.loads(phase2_response.choices[0].message.content)
-    
     return {
         "status": "evaluated",
         "score": evaluation["score"],
         "component_evaluations": evaluation["component_evaluations"],
-        "overall_feedback": evaluation["overall_feedback"]
+        "overall_feedback": evaluation["overall_feedback"],
+        "context": packing
     }
 
-def cleanup_chromadb():
-    """Clean up ChromaDB after analysis"""
+def save_upload(upload_file, workspace: str) -> str:
+    """Copy the uploaded zip into the workspace and return its path"""
+    zip_path = os.path.join(workspace, os.path.basename(upload_file.filename or "upload.zip"))
+    with open(zip_path, "wb") as buffer:
+        shutil.copyfileobj(upload_file.file, buffer)
+    return zip_path
+
+def extract_zip(zip_path: str, workspace: str) -> Tuple[str, List[str]]:
+    """Extract only the supported, non-ignored members inside the workspace and return the project root"""
+    extract_dir = os.path.join(workspace, "extracted")
+    os.makedirs(extract_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        infos, root, skipped = select_zip_members(zip_ref)
+        zip_ref.extractall(extract_dir, members=infos)
+
+    
+    project_dir = os.path.join(extract_dir, root)
+    return (project_dir if os.path.isdir(project_dir) else extract_dir), skipped
+
+def load_submission(zip_source, workspace: str = None) -> Tuple[List[dict], dict]:
+    """Read the submission's code files, in memory or by extracting into the workspace"""
+    skipped = []
     try:
-        client = get_chroma_client()
-        client.delete_collection("code_analysis")
-        logger.info("Cleaned up ChromaDB collection")
+        if workspace is None or INGESTION_MODE == "memory":
+            stream = iter_zip_code_files(zip_source, skipped)
+        else:
+            project_dir, skipped = extract_zip(zip_source, workspace)
+            stream = iter_code_files(project_dir, skipped)
+        code_files, report = filter_code_files(stream)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zip file: {str(e)}")
+    
+    if report["libraries"] or report["generated"]:
+        logger.info(f"Excluded {len(report['libraries'])} vendored library files and {len(report['generated'])} minified or generated files")
+    return code_files, {"skipped": sorted(set(skipped)), **report}
+
+def cleanup_chromadb(collection_name: str):
+    """Clean up the submission's vector index after analysis"""
+    try:
+        drop_vector_index(collection_name)
+        logger.info(f"Cleaned up vector index {collection_name}")
     except Exception as e:
         logger.error(f"Error cleaning up ChromaDB: {e}")
 
+def parse_analysis_request(
+    project_about: str,
+    technology: str,
+    problem_statement: str,
+    scoring_pattern: str
+) -> AnalysisRequest:
+    """Validate the submitted form fields and build an AnalysisRequest"""
+    try:
+        scoring_data = json.loads(scoring_pattern)
+        scoring_objects = [ScoringPattern(**item) for item in scoring_data]
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail="Invalid scoring pattern format")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error parsing scoring pattern: {str(e)}")
+    
+    
+    total_score = sum(item.max_score for item in scoring_objects)
+    if total_score != 100:
+        raise HTTPException(status_code=400, detail="Scoring pattern must sum to 100")
+    
+    
+    return AnalysisRequest(
+        project_about=project_about,
+        technology=technology,
+        problem_statement=problem_statement,
+        scoring_pattern=scoring_objects
+    )
+
+async def evaluate_project(
+    zip_source,
+    workspace: str,
+    analysis_request: AnalysisRequest,
+    student_id: Optional[str] = None
+) -> dict:
+    """Run the read -> index -> analyze pipeline for one upload (a zip path or file object)"""
+    code_files, ingestion = await asyncio.to_thread(load_submission, zip_source, workspace)
+
+    
+    fingerprint = await asyncio.to_thread(fingerprint_files, code_files)
+    rubric = rubric_key(analysis_request)
+    stored = await asyncio.to_thread(get_result_store().get, fingerprint, rubric)
+    if stored is not None:
+        logger.info(f"Dedup hit for submission {fingerprint}")
+        return {**stored, "dedup_hit": True}
+
+    
+    if not code_files:
+        raise HTTPException(status_code=400, detail="No relevant code files found or the file is not compilable")
+
+    
+    collection_name = None
+    try:
+        if await asyncio.to_thread(is_small_project, code_files):
+            file_count = len(code_files)
+            context_items = whole_file_context_items(code_files)
+            ingestion["retrieval"] = "whole-project"
+        else:
+            collection_name = new_collection_name()
+            ingestion["indexing"] = {}
+            if student_id:
+                file_count, context_items = await asyncio.to_thread(
+                    sync_and_retrieve_student_context, code_files, student_id, collection_name, analysis_request, ingestion["indexing"]
+                )
+            else:
+                file_count = await asyncio.to_thread(index_code_files, code_files, collection_name, ingestion["indexing"])
+                context_items = await asyncio.to_thread(retrieve_context_items, collection_name, analysis_request) if file_count else []
+            if file_count == 0:
+                raise HTTPException(status_code=400, detail="No relevant code files found or the file is not compilable")
+            ingestion["retrieval"] = "vector"
+
+        
+        analysis = await analyze_with_ai(analysis_request, context_items, ingestion["libraries"])
+
+        result = {
+            "status": "success",
+            "message": f"Processed {file_count} files",
+            "analysis": analysis,
+            "evaluation_criteria": {
+                "project_about": analysis_request.project_about,
+                "technology": analysis_request.technology,
+                "problem_statement": analysis_request.problem_statement,
+                "scoring_pattern": [item.dict() for item in analysis_request.scoring_pattern]
+            },
+            "fingerprint": fingerprint,
+            "ingestion": ingestion
+        }
+        await asyncio.to_thread(get_result_store().put, fingerprint, rubric, result)
+        return {**result, "dedup_hit": False}
+    finally:
+        if collection_name:
+            await asyncio.to_thread(cleanup_chromadb, collection_name)
+
 @app.post("/analyze-project")
 async def analyze_project(
     zip_file: UploadFile = File(...),
     project_about: str = Form(...),
     technology: str = Form(...),
     problem_statement: str = Form(...),
-    scoring_pattern: str = Form(...)
+    scoring_pattern: str = Form(...),
+    student_id: Optional[str] = Form(None)
 ):
+    temp_dir = None
     try:
-        
-        import json
-        try:
-            scoring_data = json.loads(scoring_pattern)
-            scoring_objects = [ScoringPattern(**item) for item in scoring_data]
-        except json.JSONDecodeError as e:
-            raise HTTPException(status_code=400, detail="Invalid scoring pattern format")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error parsing scoring pattern: {str(e)}")
-        
-        
-        total_score = sum(item.max_score for item in scoring_objects)
-        if total_score != 100:
-            raise HTTPException(status_code=400, detail="Scoring pattern must sum to 100")
-        
-        
-        analysis_request = AnalysisRequest(
-            project_about=project_about,
-            technology=technology,
-            problem_statement=problem_statement,
-            scoring_pattern=scoring_objects
-        )
+        analysis_request = parse_analysis_request(project_about, technology, problem_statement, scoring_pattern)
         
         
-        temp_dir = "temp_project"
-        os.makedirs(temp_dir, exist_ok=True)
+        if INGESTION_MODE == "memory":
+            result = await evaluate_project(zip_file.file, None, analysis_request, student_id)
+        else:
+            temp_dir = await asyncio.to_thread(create_workspace)
+            zip_path = await asyncio.to_thread(save_upload, zip_file, temp_dir)
+            result = await evaluate_project(zip_path, temp_dir, analysis_request, student_id)
 
-        
-        zip_path = os.path.join(temp_dir, zip_file.filename)
-        with open(zip_path, "wb") as buffer:
-            shutil.copyfileobj(zip_file.file, buffer)
+        return JSONResponse(result)
 
-        
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error in analyze_project: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if temp_dir:
+            await asyncio.to_thread(remove_workspace, temp_dir)
 
+async def job_worker(worker_id: int):
+    """Pull queued jobs and run the analysis pipeline for each"""
+    while True:
+        job_id = await job_queue.get()
+        job = jobs.get(job_id)
+        if job is None:
+            job_queue.task_done()
+            continue
         
-        project_dir = temp_dir
-        contents = os.listdir(temp_dir)
-        
-        
-        if len(contents) == 1 and os.path.isdir(os.path.join(temp_dir, contents[0])):
-            project_dir = os.path.join(temp_dir, contents[0])
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        try:
+            job["result"] = await evaluate_project(job["zip_path"], job["workspace"], job["analysis_request"], job["student_id"])
+            job["status"] = "completed"
+        except HTTPException as he:
+            job["status"] = "failed"
+            job["error"] = {"status_code": he.status_code, "detail": he.detail}
+        except Exception as e:
+            logger.error(f"Error in job {job_id}: {str(e)}")
+            job["status"] = "failed"
+            job["error"] = {"status_code": 500, "detail": str(e)}
+        finally:
+            job["finished_at"] = time.time()
+            await asyncio.to_thread(remove_workspace, job["workspace"])
+            job_queue.task_done()
 
-        
-        file_count = setup_chromadb(project_dir)
-        if file_count == 0:
-            raise HTTPException(status_code=400, detail="No relevant code files found or the file is not compilable")
+def reap_finished_jobs(max_age: int = JOB_TTL_SECONDS) -> int:
+    """Forget finished jobs whose results have been kept for more than max_age seconds"""
+    cutoff = time.time() - max_age
+    expired = [
+        job_id for job_id, job in list(jobs.items())
+        if job.get("finished_at") and job["finished_at"] < cutoff
+    ]
+    for job_id in expired:
+        jobs.pop(job_id, None)
+    return len(expired)
 
-        
-        analysis = analyze_with_ai(project_dir, analysis_request)
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    zip_file: UploadFile = File(...),
+    project_about: str = Form(...),
+    technology: str = Form(...),
+    problem_statement: str = Form(...),
+    scoring_pattern: str = Form(...),
+    student_id: Optional[str] = Form(None)
+):
+    analysis_request = parse_analysis_request(project_about, technology, problem_statement, scoring_pattern)
+    
+    
+    temp_dir = await asyncio.to_thread(create_workspace)
+    try:
+        zip_path = await asyncio.to_thread(save_upload, zip_file, temp_dir)
+    except Exception as e:
+        await asyncio.to_thread(remove_workspace, temp_dir)
+        logger.error(f"Error storing upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    
+    job_id = uuid.uuid4().hex
+    jobs[job_id] = {
+        "status": "queued",
+        "created_at": time.time(),
+        "workspace": temp_dir,
+        "zip_path": zip_path,
+        "analysis_request": analysis_request,
+        "student_id": student_id
+    }
+    await job_queue.put(job_id)
+    
+    return JSONResponse({"job_id": job_id, "status": "queued"}, status_code=202)
 
-        
-        shutil.rmtree(temp_dir, ignore_errors=True)
-        cleanup_chromadb()
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JSONResponse({
+        "job_id": job_id,
+        "status": job["status"],
+        "result": job.get("result"),
+        "error": job.get("error")
+    })
 
-        return JSONResponse({
-            "status": "success",
-            "message": f"Processed {file_count} files",
-            "analysis": analysis,
-            "evaluation_criteria": {
-                "project_about": project_about,
-                "technology": technology,
-                "problem_statement": problem_statement,
-                "scoring_pattern": [item.dict() for item in scoring_objects]
-            }
-        })
+def inner_submission_members(zip_file) -> Optional[List[zipfile.ZipInfo]]:
+    """Return the inner zips of a zip-of-zips within the bulk budgets, or None if it is a single submission"""
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        members = [
+            info for info in zip_ref.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+        ]
+    if not members or not all(info.filename.lower().endswith(".zip") for info in members):
+        return None
+    
+    
+    if len(members) > MAX_ZIP_MEMBERS:
+        raise HTTPException(status_code=413, detail=f"Bulk zip has {len(members)} submissions, limit is {MAX_ZIP_MEMBERS}")
+    total_bytes = sum(info.file_size for info in members)
+    if total_bytes > BULK_MAX_EXTRACT_BYTES:
+        raise HTTPException(status_code=413, detail=f"Bulk zip submissions total {total_bytes} bytes, limit is {BULK_MAX_EXTRACT_BYTES}")
+    return members
 
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        logger.error(f"Error in analyze_project: {str(e)}")
+def stage_bulk_upload(upload_file) -> List[Tuple[str, str, str]]:
+    """Save a bulk upload and return (submission name, workspace, zip path) for each submission it holds
+
+    A zip of zips is read straight from the upload and checked against the bulk budgets
+    before any workspace is created.
+    """
+    members = inner_submission_members(upload_file.file)
+    if members is None:
+        upload_file.file.seek(0)
+        workspace = create_workspace()
+        try:
+            zip_path = save_upload(upload_file, workspace)
+        except Exception:
+            remove_workspace(workspace)
+            raise
+        return [(upload_file.filename or os.path.basename(zip_path), workspace, zip_path)]
+    
+    
+    staged = []
+    try:
+        with zipfile.ZipFile(upload_file.file, 'r') as zip_ref:
+            for info in members:
+                inner_workspace = create_workspace()
+                inner_path = os.path.join(inner_workspace, os.path.basename(info.filename))
+                staged.append((info.filename, inner_workspace, inner_path))
+                with zip_ref.open(info) as source, open(inner_path, "wb") as target:
+                    shutil.copyfileobj(source, target)
+        return staged
+    except Exception:
+        for _, inner_workspace, _ in staged:
+            remove_workspace(inner_workspace)
+        raise
+
+@app.post("/bulk-analyze")
+async def bulk_analyze(
+    zip_files: List[UploadFile] = File(...),
+    project_about: str = Form(...),
+    technology: str = Form(...),
+    problem_statement: str = Form(...),
+    scoring_pattern: str = Form(...)
+):
+    analysis_request = parse_analysis_request(project_about, technology, problem_statement, scoring_pattern)
+    
+    
+    submissions = []
+    staging_errors = []
+    for upload in zip_files:
+        try:
+            submissions.extend(await asyncio.to_thread(stage_bulk_upload, upload))
+        except HTTPException as he:
+            logger.error(f"Error staging {upload.filename}: {he.detail}")
+            staging_errors.append({
+                "submission": upload.filename,
+                "status": "failed",
+                "error": {"status_code": he.status_code, "detail": he.detail}
+            })
+        except zipfile.BadZipFile as e:
+            logger.error(f"Error staging {upload.filename}: {str(e)}")
+            staging_errors.append({
+                "submission": upload.filename,
+                "status": "failed",
+                "error": {"status_code": 400, "detail": f"Invalid zip file: {str(e)}"}
+            })
+        except Exception as e:
+            logger.error(f"Error staging {upload.filename}: {str(e)}")
+            staging_errors.append({
+                "submission": upload.filename,
+                "status": "failed",
+                "error": {"status_code": 500, "detail": str(e)}
+            })
+    
+    
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def evaluate_submission(name: str, workspace: str, zip_path: str) -> dict:
+        try:
+            async with semaphore:
+                result = await evaluate_project(zip_path, workspace, analysis_request)
+            return {"submission": name, "status": "completed", "result": result}
+        except HTTPException as he:
+            return {"submission": name, "status": "failed", "error": {"status_code": he.status_code, "detail": he.detail}}
+        except Exception as e:
+            logger.error(f"Error evaluating {name}: {str(e)}")
+            return {"submission": name, "status": "failed", "error": {"status_code": 500, "detail": str(e)}}
+        finally:
+            await asyncio.to_thread(remove_workspace, workspace)
+
+    async def stream_results():
+        for error in staging_errors:
+            yield json.dumps(error) + "\n"
         
-        shutil.rmtree("temp_project", ignore_errors=True)
-        cleanup_chromadb()
-        raise HTTPException(status_code=500, detail=str(e))
+        tasks = [asyncio.create_task(evaluate_submission(*submission)) for submission in submissions]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            for _, workspace, _ in submissions:
+                await asyncio.to_thread(remove_workspace, workspace)
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.get("/ready")
+async def ready():
+    readiness = app.state.readiness
+    return JSONResponse(
+        {"ready": all(readiness.values()), "components": readiness, "warnings": app.state.readiness_warnings},
+        status_code=200 if all(readiness.values()) else 503
+    )
+
+@app.get("/stats/embedding-cache")
+async def embedding_cache_stats():
+    return JSONResponse(await asyncio.to_thread(get_embedding_function().stats))
+
+@app.get("/stats/llm-cache")
+async def llm_cache_stats():
+    return JSONResponse(await asyncio.to_thread(get_llm_cache().stats))
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
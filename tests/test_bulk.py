@@ -0,0 +1,72 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+RUBRIC = json.dumps([{"component": "Navbar", "max_score": 100}])
+FORM = {"project_about": "Site", "technology": "HTML", "problem_statement": "Build a site", "scoring_pattern": RUBRIC}
+
+
+def make_zip(members: dict, compression: int = zipfile.ZIP_DEFLATED) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as zip_ref:
+        for name, data in members.items():
+            zip_ref.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "WORKSPACE_ROOT", str(tmp_path / "workspaces"))
+
+    async def fake_evaluate(zip_source, workspace, analysis_request, student_id=None):
+        await main.asyncio.to_thread(main.load_submission, zip_source, workspace)
+        return {"status": "success"}
+
+    monkeypatch.setattr(main, "evaluate_project", fake_evaluate)
+    return TestClient(main.app)
+
+
+def bulk(client, *uploads):
+    response = client.post("/bulk-analyze", files=[("zip_files", upload) for upload in uploads], data=FORM)
+    assert response.status_code == 200
+    return {line["submission"]: line for line in map(json.loads, response.text.splitlines())}
+
+
+def test_zip_of_zips_is_split_into_submissions(client):
+    project = make_zip({"index.html": "<nav></nav>"})
+    results = bulk(client, ("class.zip", make_zip({"alice.zip": project, "bob.zip": project})))
+
+    assert {name: line["status"] for name, line in results.items()} == {"alice.zip": "completed", "bob.zip": "completed"}
+    assert os.listdir(main.WORKSPACE_ROOT) == []
+
+
+def test_corrupt_outer_and_inner_zips_are_both_400(client):
+    results = bulk(client, ("broken.zip", b"not a zip"), ("class.zip", make_zip({"carol.zip": b"not a zip either"})))
+
+    assert results["broken.zip"]["error"]["status_code"] == 400
+    assert results["carol.zip"]["error"]["status_code"] == 400
+
+
+def test_too_many_inner_submissions_is_413_before_staging(client, monkeypatch):
+    monkeypatch.setattr(main, "MAX_ZIP_MEMBERS", 2)
+    project = make_zip({"index.html": "<nav></nav>"})
+    results = bulk(client, ("class.zip", make_zip({f"s{i}.zip": project for i in range(3)})))
+
+    assert results["class.zip"]["error"]["status_code"] == 413
+    assert not os.path.exists(main.WORKSPACE_ROOT) or os.listdir(main.WORKSPACE_ROOT) == []
+
+
+def test_oversized_inner_submissions_are_413_before_staging(client, monkeypatch):
+    monkeypatch.setattr(main, "BULK_MAX_EXTRACT_BYTES", 1024 * 1024)
+    padded = make_zip({"index.html": "<nav></nav>", "data.json": " " * (2 * 1024 * 1024)}, zipfile.ZIP_STORED)
+    results = bulk(client, ("class.zip", make_zip({"dave.zip": padded, "erin.zip": padded})))
+
+    assert len(make_zip({"dave.zip": padded})) < 1024 * 1024
+    assert results["class.zip"]["error"]["status_code"] == 413
+    assert not os.path.exists(main.WORKSPACE_ROOT) or os.listdir(main.WORKSPACE_ROOT) == []
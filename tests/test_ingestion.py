@@ -0,0 +1,99 @@
+import codecs
+
+from main import IgnoreSpec, chunk_code_file, decode_source
+
+
+def test_ignore_spec_globs_and_directory_rules():
+    spec = IgnoreSpec(["node_modules/", "*.log", "# comment", ""])
+
+    assert spec.matches("node_modules", is_dir=True)
+    assert spec.matches("frontend/node_modules", is_dir=True)
+    assert not spec.matches("node_modules", is_dir=False)
+    assert spec.matches("logs/server.log", is_dir=False)
+    assert not spec.matches("src/app.js", is_dir=False)
+
+
+def test_ignore_spec_negation_last_rule_wins():
+    spec = IgnoreSpec(["*.log", "!keep.log"])
+
+    assert spec.matches("debug.log", is_dir=False)
+    assert not spec.matches("logs/keep.log", is_dir=False)
+    assert spec.extend(["keep.log"]).matches("logs/keep.log", is_dir=False)
+
+
+def test_ignore_spec_anchored_patterns_match_from_the_root():
+    spec = IgnoreSpec(["/build", "docs/*.md"])
+
+    assert spec.matches("build", is_dir=True)
+    assert not spec.matches("src/build", is_dir=True)
+    assert spec.matches("docs/setup.md", is_dir=False)
+    assert not spec.matches("src/docs/setup.md", is_dir=False)
+
+
+def test_ignore_spec_wildcards_do_not_cross_directories():
+    assert IgnoreSpec(["/*.js"]).matches("app.js", is_dir=False)
+    assert not IgnoreSpec(["/*.js"]).matches("src/app.js", is_dir=False)
+    assert not IgnoreSpec(["docs/*.md"]).matches("docs/a/b.md", is_dir=False)
+    assert not IgnoreSpec(["src/?.js"]).matches("src/a/b.js", is_dir=False)
+
+
+def test_ignore_spec_double_star_patterns():
+    assert IgnoreSpec(["**/foo/bar"]).matches("x/foo/bar", is_dir=True)
+    assert IgnoreSpec(["**/foo/bar"]).matches("foo/bar", is_dir=True)
+    assert IgnoreSpec(["**/foo"]).matches("a/b/foo", is_dir=False)
+    assert IgnoreSpec(["logs/**"]).matches("logs/a/b.txt", is_dir=False)
+    assert IgnoreSpec(["a/**/b"]).matches("a/b", is_dir=True)
+    assert IgnoreSpec(["a/**/b"]).matches("a/x/y/b", is_dir=True)
+    assert not IgnoreSpec(["a/**/b"]).matches("c/a/b", is_dir=True)
+
+
+def test_ignore_spec_character_classes():
+    assert IgnoreSpec(["*.py[cod]"]).matches("pkg/mod.pyc", is_dir=False)
+    assert not IgnoreSpec(["file[!0-9].txt"]).matches("file1.txt", is_dir=False)
+    assert IgnoreSpec(["file[!0-9].txt"]).matches("filea.txt", is_dir=False)
+
+
+def test_decode_source_utf8_and_bom():
+    assert decode_source("héllo".encode("utf-8")) == ("héllo", "utf-8", 0)
+    assert decode_source(codecs.BOM_UTF8 + "héllo".encode("utf-8")) == ("héllo", "utf-8-sig", 0)
+
+
+def test_decode_source_falls_back_to_latin1_losslessly():
+    text, encoding, replacements = decode_source("héllo wörld".encode("latin-1"))
+
+    assert (text, encoding) == ("héllo wörld", "latin-1")
+    assert replacements == 2
+
+
+def test_chunk_code_file_empty_file_has_no_chunks():
+    assert chunk_code_file({"path": "empty.js", "content": ""}) == []
+    assert chunk_code_file({"path": "blank.py", "content": "\n\n   \n"}) == []
+
+
+def test_chunk_code_file_splits_python_on_definitions():
+    content = "".join(
+        f"def handler_{i}():\n" + "".join(f"    value = {j}\n" for j in range(20)) + "    return value\n\n"
+        for i in range(4)
+    )
+    chunks = chunk_code_file({"path": "app.py", "content": content}, max_chars=450)
+
+    assert len(chunks) > 1
+    assert all(chunk["content"].lstrip().startswith("def handler_") for chunk in chunks)
+
+
+def test_chunk_code_file_unparsable_python_falls_back_to_blank_lines():
+    content = "def broken(:\n    pass\n\nx = 1\ny = 2\n\nprint(x + y)\n"
+    chunks = chunk_code_file({"path": "broken.py", "content": content}, max_chars=25)
+
+    assert [chunk["content"] for chunk in chunks] == ["def broken(:\n    pass\n", "x = 1\ny = 2\n", "print(x + y)\n"]
+    assert [(chunk["start_line"], chunk["end_line"]) for chunk in chunks] == [(1, 3), (4, 6), (7, 8)]
+
+
+def test_chunk_code_file_keeps_an_oversized_line_whole():
+    long_line = "const data = [" + ", ".join(str(i) for i in range(1000)) + "];"
+    content = f"let a = 1;\n{long_line}\nlet b = 2;\n"
+    chunks = chunk_code_file({"path": "data.js", "content": content}, max_chars=200)
+
+    assert any(chunk["content"] == long_line for chunk in chunks)
+    assert "".join(chunk["content"] for chunk in chunks).count("let ") == 2
+    assert all(len(chunk["content"]) <= 200 for chunk in chunks if chunk["content"] != long_line)
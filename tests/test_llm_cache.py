@@ -0,0 +1,65 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+
+class StubCompletions:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        content = self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def stub_client(*replies):
+    return SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(replies)))
+
+
+@pytest.fixture
+def llm_cache(tmp_path, monkeypatch):
+    cache = main.LLMResponseCache(str(tmp_path / "llm.sqlite3"), 8, "test")
+    monkeypatch.setattr(main, "_llm_cache", cache)
+    return cache
+
+
+@pytest.mark.parametrize("reply", ['{"pass": tru', '{"reasons": []}', '[1, 2]', None])
+def test_bad_responses_are_not_memoized(llm_cache, reply):
+    client = stub_client(reply)
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            asyncio.run(main.cached_completion(client, "prompt", 0.0, required_keys=("pass",)))
+
+    assert client.chat.completions.calls == 3
+    assert llm_cache.stats()["persistent_entries"] == 0
+
+
+def test_good_response_is_memoized_after_a_bad_one(llm_cache):
+    client = stub_client('{"pass": tru', json.dumps({"pass": True, "reasons": []}))
+
+    with pytest.raises(ValueError):
+        asyncio.run(main.cached_completion(client, "prompt", 0.0, required_keys=("pass",)))
+    first = asyncio.run(main.cached_completion(client, "prompt", 0.0, required_keys=("pass",)))
+    second = asyncio.run(main.cached_completion(client, "prompt", 0.0, required_keys=("pass",)))
+
+    assert first == second == {"pass": True, "reasons": []}
+    assert client.chat.completions.calls == 2
+
+
+def test_unusable_cached_entry_is_refetched(llm_cache):
+    key = llm_cache.key("prompt", main.ANALYSIS_MODEL, 0.0)
+    llm_cache.put(key, '{"truncated": ')
+    client = stub_client(json.dumps({"pass": False, "reasons": ["missing navbar"]}))
+
+    result = asyncio.run(main.cached_completion(client, "prompt", 0.0, required_keys=("pass",)))
+
+    assert result["reasons"] == ["missing navbar"]
+    assert client.chat.completions.calls == 1
+    assert llm_cache.get(key) == json.dumps({"pass": False, "reasons": ["missing navbar"]})
@@ -0,0 +1,107 @@
+import numpy as np
+
+from main import BM25Index, count_tokens, diversify_context_items, pack_context, render_context_block, retrieval_evidence
+
+
+def _bm25(documents: dict) -> BM25Index:
+    index = BM25Index()
+    index.add(list(documents), list(documents.values()), [{"path": chunk_id} for chunk_id in documents])
+    return index
+
+
+def test_bm25_matches_split_identifiers_and_tags():
+    index = _bm25({
+        "search": "app.js:1-2\nconst searchInput = document.getElementById('search');\nsearchInput.addEventListener('input', filterItems);",
+        "nav": "index.html:1-1\n<nav class=\"navbar\"><a href=\"#\">Home</a></nav>",
+        "math": "util.js:1-1\nfunction add(a, b) { return a + b; }",
+    })
+    result = index.query(["Search Functionality", "Navbar", "Filter buttons"], n_results=5)
+
+    assert result["ids"] == [["search"], ["nav"], ["search"]]
+
+
+def test_bm25_ignores_the_path_header_and_empty_queries():
+    index = _bm25({"a": "app.js:1-1\nlet total = 0;", "b": "main.js:1-1\nlet count = 1;"})
+
+    assert index.query(["js", "app", ""], n_results=5)["ids"] == [[], [], []]
+
+
+def test_bm25_ranks_by_term_frequency():
+    index = _bm25({"once": "a.js:1-1\ncart item", "often": "b.js:1-1\ncart cart cart item"})
+
+    assert index.query(["cart"], n_results=1)["ids"] == [["often"]]
+
+
+def _items(relevances):
+    return [{"path": f"f{i}.css", "content": "", "relevance": r, "evidence_for": {f"c{i}": r}} for i, r in enumerate(relevances)]
+
+
+def test_mmr_drops_near_duplicates_and_keeps_their_evidence():
+    items = _items([0.9, 0.8, 0.5])
+    embeddings = np.array([[1.0, 0.0], [1.0, 0.001], [0.0, 1.0]])
+    selected = diversify_context_items(items, embeddings, mmr_lambda=0.7)
+
+    assert [item["path"] for item in selected] == ["f0.css", "f2.css"]
+    assert selected[0]["evidence_for"] == {"c0": 0.9, "c1": 0.8}
+
+
+def test_retrieval_evidence_ranks_each_component_by_its_own_score():
+    items = [
+        {"path": "index.html", "start_line": 1, "end_line": 9, "evidence_for": {"Navbar": 2.0, "Search": 0.5}},
+        {"path": "app.js", "start_line": 1, "end_line": 9, "evidence_for": {"Navbar": 0.4, "Search": 1.8}},
+    ]
+
+    assert retrieval_evidence(items) == {
+        "Navbar": ["index.html:1-9", "app.js:1-9"],
+        "Search": ["app.js:1-9", "index.html:1-9"],
+    }
+
+
+def test_mmr_prefers_novel_items_over_redundant_ones():
+    items = _items([1.0, 0.9, 0.6])
+    embeddings = np.array([[1.0, 0.0], [0.9, 0.436], [0.0, 1.0]])
+    selected = diversify_context_items(items, embeddings, mmr_lambda=0.5)
+
+    assert [item["path"] for item in selected] == ["f0.css", "f2.css", "f1.css"]
+    assert all(0.0 <= item["relevance"] <= 1.0 for item in selected)
+
+
+def test_mmr_with_lambda_one_keeps_relevance_order():
+    items = _items([0.2, 0.9, 0.5])
+    embeddings = np.array([[1.0, 0.0], [0.8, 0.6], [0.6, 0.8]])
+    selected = diversify_context_items(items, embeddings, mmr_lambda=1.0)
+
+    assert [item["path"] for item in selected] == ["f1.css", "f2.css", "f0.css"]
+
+
+def _block_tokens(item):
+    return count_tokens(render_context_block(item, item["content"]))
+
+
+def test_pack_context_empty():
+    context, report = pack_context([], budget=100)
+
+    assert context == ""
+    assert report["used_tokens"] == 0
+
+
+def test_pack_context_prefers_relevance_per_token_and_orders_by_path():
+    small = {"path": "b.js", "content": "let x = 1;", "relevance": 1.0}
+    large = {"path": "a.js", "content": "\n".join(f"let value{i} = {i};" for i in range(50)), "relevance": 1.0}
+    budget = _block_tokens(small) + 5
+    context, report = pack_context([large, small], budget=budget)
+
+    assert report["included"] == ["b.js:1-?"]
+    assert report["dropped"] == ["a.js:1-?"]
+    assert context.startswith("=== FILE: b.js")
+    assert report["used_tokens"] <= budget
+
+
+def test_pack_context_truncates_an_oversized_item_head_and_tail():
+    item = {"path": "big.js", "start_line": 1, "end_line": 400, "content": "\n".join(f"console.log('line {i}');" for i in range(400))}
+    context, report = pack_context([item], budget=_block_tokens(item) // 2)
+
+    assert report["truncated"] == ["big.js:1-400"]
+    assert "line 0" in context and "line 399" in context
+    assert "truncated" in context
+    assert report["used_tokens"] <= report["budget"]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from chromadb import PersistentClient
+from chromadb.api.types import EmbeddingFunction
+
+import main
+
+APP = {"path": "app.js", "content": "\n\n".join(f"function handler{i}() {{\n{'  console.log(1);' * 40}\n}}" for i in range(6))}
+STYLE = {"path": "style.css", "content": "nav { color: red; }"}
+
+
+class FlakyEmbedding(EmbeddingFunction):
+    def __init__(self, fail_on_call=None):
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def __call__(self, input):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("embedding service unavailable")
+        return [np.array([len(document), 1.0], dtype=np.float32) for document in input]
+
+
+@pytest.fixture
+def student_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "_chroma_client", PersistentClient(path=str(tmp_path / "chroma")))
+    monkeypatch.setattr(main, "INDEX_BATCH_SIZE", 1)
+
+    def use_embedding(inner):
+        cache = main.CachedEmbeddingFunction(inner, "fake", str(tmp_path / f"embeddings-{id(inner)}.sqlite3"), 1000)
+        monkeypatch.setattr(main, "_embedding_function", cache)
+
+    return use_embedding
+
+
+def sync(code_files):
+    stats = {}
+    collection_name = main.new_collection_name()
+    try:
+        return main.sync_student_index(code_files, "student-1", collection_name, stats), stats
+    finally:
+        main.drop_vector_index(collection_name)
+
+
+def test_failed_sync_reports_failure_and_partial_files_are_reindexed(student_store):
+    assert len(main.chunk_code_file(APP)) > 2
+    student_store(FlakyEmbedding(fail_on_call=2))
+
+    file_count, _ = sync([APP, STYLE])
+
+    assert file_count == 0
+
+    student_store(FlakyEmbedding())
+    file_count, stats = sync([APP, STYLE])
+
+    assert file_count == 2
+    assert stats["changed_files"] == 2
+    collection = main.get_chroma_client().get_collection(main.student_collection_name("student-1"))
+    assert collection.count() == len(main.chunk_code_file(APP)) + 1
+
+
+def test_unchanged_files_are_reused_on_resubmission(student_store):
+    student_store(FlakyEmbedding())
+    sync([APP, STYLE])
+
+    file_count, stats = sync([APP, {**STYLE, "content": "nav { color: blue; }"}])
+
+    assert file_count == 2
+    assert (stats["changed_files"], stats["reused_files"], stats["removed_chunks"]) == (1, 1, 1)
+
+
+def test_indexing_reports_rss_change_and_labels_the_process_peak(student_store):
+    student_store(FlakyEmbedding())
+
+    _, stats = sync([APP, STYLE])
+
+    assert "peak_rss_mb" not in stats
+    assert stats["process_peak_rss_mb"] > 0
+    assert isinstance(stats["rss_delta_mb"], float)